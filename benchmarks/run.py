@@ -0,0 +1,346 @@
+"""Fetch-and-build benchmarks of the data readers against the replay server.
+
+    python -m benchmarks.run
+    python -m benchmarks.run --scenario tsetmc_daily_closing_price --workers 1 8
+    python -m benchmarks.run --check            # fail on regressions
+    python -m benchmarks.run --update-baselines
+
+Each scenario times `update_raw_table` (requests per second) and
+`update_table` (rows per second) for every worker count, keeping the median
+of `--repeat` runs, then repeats the largest worker count under tracemalloc to
+record the peak traced memory. Rates measured over less than MIN_SECONDS are
+not compared with the baselines. Tables are written to a temporary data
+directory.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+from dataclasses import dataclass
+import importlib
+import io
+import json
+import os
+from pathlib import Path
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable
+from urllib.parse import urlsplit
+
+import pandas as pd
+import requests
+
+repo_dir = Path(__file__).resolve().parent.parent
+baselines_path = Path(__file__).resolve().parent.joinpath("baselines.json")
+
+# Rates and the timings they are measured over
+HIGHER_IS_BETTER = {
+    "requests_per_second": "fetch_seconds",
+    "rows_per_second": "build_seconds",
+}
+LOWER_IS_BETTER = ("peak_mb",)
+# Rates measured over less time are too noisy to compare
+MIN_SECONDS = 0.25
+
+
+def _ins_codes(size: int) -> pd.DataFrame:
+    return pd.DataFrame({"ins_code": [str(10**16 + i) for i in range(size)]})
+
+
+def _report_pages(size: int) -> pd.DataFrame:
+    dates = pd.date_range("2023-03-21", periods=size // 5 + 1).strftime("%Y/%m/%d")
+    keys = [(date, page) for date in dates for page in range(1, 6)][:size]
+    return pd.DataFrame(keys, columns=["date", "page_number"])
+
+
+def _seo_ids(size: int) -> pd.DataFrame:
+    return pd.DataFrame({"seo_id": [str(10000 + i) for i in range(size)]})
+
+
+@dataclass(frozen=True)
+class Scenario:
+    name: str
+    module: str
+    keys: Callable[[int], pd.DataFrame] | None
+    size: int
+
+
+SCENARIOS = {
+    scenario.name: scenario
+    for scenario in [
+        Scenario(
+            "tsetmc_daily_closing_price",
+            "smdir.tsetmc.daily_closing_price",
+            _ins_codes,
+            200,
+        ),
+        Scenario(
+            "tsetmc_security_identity",
+            "smdir.tsetmc.security_identity",
+            _ins_codes,
+            500,
+        ),
+        Scenario("codal_report_list", "smdir.codal.report_list", _report_pages, 200),
+        Scenario("fipiran_fund", "smdir.fipiran.fund", _seo_ids, 500),
+        Scenario("cfi_institute_list", "smdir.cfi.institute_list", None, 1),
+        Scenario("ifb_bond_page", "smdir.ifb.datareader", None, 200),
+    ]
+}
+
+
+def _local_reader(module, base_url: str):
+    # pylint: disable=import-outside-toplevel
+    from smdir.retry import RetryPolicy
+
+    url = urlsplit(module.reader.url_pattern)
+    url_pattern = base_url + url.path + (f"?{url.query}" if url.query else "")
+    reader = type(module.reader)(url_pattern, module.table_metadata)
+    reader.retry_policy = RetryPolicy(attempts=5, base_delay=0.01, max_delay=0.1)
+    return reader
+
+
+def _remove_table(table_metadata) -> None:
+    for path in [table_metadata.path, table_metadata.raw, table_metadata.raw_segments]:
+        if path.is_dir():
+            shutil.rmtree(path)
+        else:
+            path.unlink(missing_ok=True)
+
+
+def _request_count(report: dict) -> tuple[int, int]:
+    requests_total = retries = 0
+    for counter in report["counters"]:
+        if counter["name"] == "smdir_requests_total":
+            requests_total += counter["value"]
+        elif counter["name"] == "smdir_retries_total":
+            retries += counter["value"]
+    return int(requests_total), int(retries)
+
+
+def run_reader(
+    scenario: Scenario, base_url: str, workers: int, engine: str, parse_workers: int
+) -> dict:
+    # pylint: disable=import-outside-toplevel
+    from smdir.metrics import metrics
+
+    module = importlib.import_module(scenario.module)
+    reader = _local_reader(module, base_url)
+    reader.max_workers = workers
+    reader.parse_workers = parse_workers
+    _remove_table(module.table_metadata)
+    key_frame = (
+        pd.DataFrame() if scenario.keys is None else scenario.keys(scenario.size)
+    )
+    metrics.reset()
+    start = time.perf_counter()
+    reader.update_raw_table(key_frame, ignore_existing=False, engine=engine)
+    fetched = time.perf_counter()
+    reader.update_table(incremental=False)
+    built = time.perf_counter()
+    rows = len(reader.open_table().index)
+    requests_total, retries = _request_count(metrics.report())
+    return {
+        "fetch_seconds": round(fetched - start, 3),
+        "build_seconds": round(built - fetched, 3),
+        "requests_per_second": round(requests_total / (fetched - start), 1),
+        "rows_per_second": round(rows / (built - fetched), 1),
+        "rows": rows,
+        "retries": retries,
+    }
+
+
+def run_ifb(
+    scenario: Scenario, base_url: str, workers: int, engine: str, parse_workers: int
+) -> dict:
+    """Fetch bond pages concurrently, then time `extract_data_from_pages`."""
+    # pylint: disable=import-outside-toplevel,unused-argument
+    from smdir.metadata_reader import lib_settings
+
+    ifb = importlib.import_module(scenario.module)
+    _remove_table(ifb.bond_page_metadata)
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=workers))
+
+    retries = []
+
+    def get_page(record_id: int) -> str:
+        for _ in range(4):
+            response = session.get(f"{base_url}/InstrumentsMFI.aspx?id={record_id}")
+            if response.status_code != 503:
+                break
+            retries.append(record_id)
+        response.raise_for_status()
+        return response.text
+
+    record_ids = list(range(1, scenario.size + 1))
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers) as executor:
+        pages = list(executor.map(get_page, record_ids))
+    fetched = time.perf_counter()
+    payment_table = {"date": ["1402/01/01", "1402/07/01"], "value": ["1,000", "2/5"]}
+    pd.DataFrame(
+        {
+            "IFB_ID": record_ids,
+            "page": pages,
+            "payment_table": [payment_table] * len(pages),
+            "received_time": pd.Timestamp.now(),
+        }
+    ).to_parquet(ifb.bond_page_metadata, index=False)
+    default_parse_workers = lib_settings.parse_workers
+    lib_settings.parse_workers = parse_workers
+    try:
+        parsed = time.perf_counter()
+        _, info_table = ifb.extract_data_from_pages()
+        built = time.perf_counter()
+    finally:
+        lib_settings.parse_workers = default_parse_workers
+    return {
+        "fetch_seconds": round(fetched - start, 3),
+        "build_seconds": round(built - parsed, 3),
+        "requests_per_second": round(
+            (len(pages) + len(retries)) / (fetched - start), 1
+        ),
+        "rows_per_second": round(len(info_table.index) / (built - parsed), 1),
+        "rows": len(info_table.index),
+        "retries": len(retries),
+    }
+
+
+def run_scenario(scenario: Scenario, base_url: str, args: argparse.Namespace) -> dict:
+    runner = run_ifb if scenario.name.startswith("ifb_") else run_reader
+    result: dict = {"workers": {}}
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Interleave the repeats so slow spells on the host hit every worker count
+        runs: dict[int, list[dict]] = {workers: [] for workers in args.workers}
+        for _ in range(args.repeat):
+            for workers in args.workers:
+                runs[workers].append(
+                    runner(scenario, base_url, workers, args.engine, args.parse_workers)
+                )
+        for workers in args.workers:
+            result["workers"][str(workers)] = _median(runs[workers])
+        if not args.no_memory:
+            tracemalloc.start()
+            runner(scenario, base_url, max(args.workers), args.engine, 1)
+            result["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+            tracemalloc.stop()
+    return result
+
+
+def _median(runs: list[dict]) -> dict:
+    """Keep the median fetch and the median build of repeated runs."""
+    result = runs[0].copy()
+    for rate, seconds in HIGHER_IS_BETTER.items():
+        median = sorted(runs, key=lambda run, rate=rate: run[rate])[len(runs) // 2]
+        result[rate], result[seconds] = median[rate], median[seconds]
+    return result
+
+
+def _metric_values(result: dict) -> dict[str, float]:
+    values = {"peak_mb": result["peak_mb"]} if "peak_mb" in result else {}
+    for workers, measures in result["workers"].items():
+        for rate, seconds in HIGHER_IS_BETTER.items():
+            if measures[seconds] >= MIN_SECONDS:
+                values[f"{rate}@{workers}"] = measures[rate]
+    return values
+
+
+def compare(results: dict, baselines: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for name, result in results.items():
+        baseline = baselines.get("scenarios", {}).get(name)
+        if baseline is None:
+            continue
+        current, previous = _metric_values(result), _metric_values(baseline)
+        for metric, value in current.items():
+            if metric not in previous:
+                continue
+            if metric.split("@")[0] in LOWER_IS_BETTER:
+                regressed = value > previous[metric] * (1 + tolerance)
+            else:
+                regressed = value < previous[metric] * (1 - tolerance)
+            if regressed:
+                regressions.append(f"{name} {metric}: {previous[metric]} -> {value}")
+    return regressions
+
+
+def start_server(args: argparse.Namespace) -> tuple[subprocess.Popen, str]:
+    command = [sys.executable, "-m", "benchmarks.server", "--port", "0"]
+    command += ["--latency", str(args.latency), "--error-rate", str(args.error_rate)]
+    if args.replay_dir is not None:
+        command += ["--replay-dir", str(args.replay_dir.resolve())]
+    server = subprocess.Popen(command, cwd=repo_dir, stdout=subprocess.PIPE, text=True)
+    assert server.stdout is not None
+    port = int(server.stdout.readline())
+    return server, f"http://127.0.0.1:{port}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", nargs="+", choices=list(SCENARIOS))
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 4, 16])
+    parser.add_argument("--engine", choices=["thread", "async"], default="thread")
+    parser.add_argument("--parse-workers", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds")
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--replay-dir", type=Path)
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--update-baselines", action="store_true")
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(repo_dir))
+    data_dir = tempfile.mkdtemp(prefix="smdir-benchmarks-")
+    os.chdir(data_dir)
+    server, base_url = start_server(args)
+    results = {}
+    try:
+        for name in args.scenario or list(SCENARIOS):
+            results[name] = run_scenario(SCENARIOS[name], base_url, args)
+            print(name, json.dumps(results[name]), flush=True)
+    finally:
+        server.terminate()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    report = {
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "settings": {
+            "engine": args.engine,
+            "parse_workers": args.parse_workers,
+            "latency": args.latency,
+            "error_rate": args.error_rate,
+        },
+        "scenarios": results,
+    }
+    if args.output is not None:
+        args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    if args.update_baselines:
+        if baselines_path.exists():
+            baselines = json.loads(baselines_path.read_text(encoding="utf-8"))
+            report["scenarios"] = baselines["scenarios"] | results
+        baselines_path.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+        return
+    if not baselines_path.exists():
+        return
+    baselines = json.loads(baselines_path.read_text(encoding="utf-8"))
+    regressions = compare(results, baselines, args.tolerance)
+    for regression in regressions:
+        print("regression:", regression)
+    if args.check and regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""Local stand-in for the TSETMC, Codal, FIPIRAN, CFI and IFB endpoints.
+
+Responses are replayed from a directory of recorded bodies when one matches
+the request, and synthesized deterministically from the request otherwise.
+
+    python -m benchmarks.server --port 8080 --latency 0.05 --error-rate 0.02
+
+Recorded bodies are looked up as `<replay_dir>/<recorded_name(path)>`, where
+`path` includes the query string.
+"""
+
+import argparse
+from hashlib import sha256
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from pathlib import Path
+import random
+import sys
+import time
+from urllib.parse import parse_qs, urlsplit
+
+FUND_FIELDS = {
+    "regNo": str, "name": str, "initiationDate": str, "fundSize": int,
+    "fundType": int, "executiveManager": str, "articlesOfAssociationLink": str,
+    "prosoectusLink": str, "lastModificationTime": str, "date": str,
+    "dailyEfficiency": float, "weeklyEfficiency": float,
+    "monthlyEfficiency": float, "quarterlyEfficiency": float,
+    "sixMonthEfficiency": float, "annualEfficiency": float,
+    "dividendIntervalPeriod": int, "estimatedEarningRate": float,
+    "guaranteedEarningRate": float, "insInvNo": int, "insInvPercent": float,
+    "legalPercent": float, "marketMaker": str, "naturalPercent": float,
+    "netAsset": int, "retInvNo": int, "retInvPercent": float,
+    "investedUnits": int, "unitsRedDAY": int, "unitsRedFromFirst": int,
+    "unitsSubDAY": int, "unitsSubFromFirst": int, "efficiency": float,
+    "cancelNav": float, "issueNav": float, "statisticalNav": float,
+    "fiveBest": float, "stock": float, "bond": float, "other": float,
+    "cash": float, "deposit": float, "fundUnit": float, "commodity": float,
+    "typeOfInvest": str, "rankOf12Month": int, "rankOf24Month": int,
+    "rankOf36Month": int, "rankOf48Month": int, "rankOf60Month": int,
+    "rankLastUpdate": str, "manager": str, "managerSeoRegisterNo": str,
+    "guarantorSeoRegisterNo": str, "auditor": str, "custodian": str,
+    "guarantor": str, "investmentManager": str, "beta": float, "alpha": float,
+    "seoRegisterDate": str, "registrationNumber": str, "registerDate": str,
+    "nationalId": str, "isCompleted": bool, "insCode": str, "fundPublisher": int,
+}  # fmt: skip
+
+IFB_TITLES = [
+    "نام شرکت", "نماد", "نام شرکت", "نمونیک", "ISIN", "بازار", "صنعت",
+    "زیر گروه صنعت", "نام", "مبلغ اسمی هر ورقه", "مبلغ کل اوراق",
+    "مبلغ پذیرش شده", "تاریخ انتشار", "مدت(ماه)", "موضوع", "موضوع",
+    "نرخ سود اسمی", "تعداد کل اوراق", "تعداد اوراق پذیرش شده", "تاریخ سررسید",
+]  # fmt: skip
+
+
+def recorded_name(path: str) -> str:
+    return sha256(path.encode("utf-8")).hexdigest()[:32] + ".body"
+
+
+def _seed(*parts: object) -> random.Random:
+    return random.Random(sha256(repr(parts).encode()).digest())
+
+
+def _date_id(day: int) -> int:
+    year, day = divmod(day, 336)
+    month, day = divmod(day, 28)
+    return (2000 + year) * 10000 + (month + 1) * 100 + day + 1
+
+
+def closing_prices(ins_code: str, days: int) -> dict:
+    rng = _seed("closing_prices", ins_code)
+    price = rng.uniform(1_000, 100_000)
+    records = []
+    for day in range(days):
+        previous, price = price, price * rng.uniform(0.95, 1.05)
+        records.append(
+            {
+                "priceChange": round(price - previous, 2),
+                "priceMin": round(price * 0.98, 2),
+                "priceMax": round(price * 1.02, 2),
+                "priceYesterday": round(previous, 2),
+                "priceFirst": round(previous, 2),
+                "last": False,
+                "id": 0,
+                "insCode": ins_code,
+                "dEven": _date_id(day),
+                "hEven": 122959,
+                "pClosing": round(price, 2),
+                "iClose": False,
+                "yClose": False,
+                "pDrCotVal": round(price, 2),
+                "zTotTran": float(rng.randint(0, 500)),
+                "qTotTran5J": float(rng.randint(0, 10**6)),
+                "qTotCap": float(rng.randint(0, 10**10)),
+            }
+        )
+    return {"closingPriceDaily": records}
+
+
+def instrument_identity(ins_code: str) -> dict:
+    rng = _seed("instrument_identity", ins_code)
+    sector = rng.randint(1, 70)
+    return {
+        "instrumentIdentity": {
+            "sector": {"dEven": 0, "cSecVal": f"{sector} ", "lSecVal": "فلزات اساسی"},
+            "subSector": {
+                "dEven": 0,
+                "cSecVal": None,
+                "cSoSecVal": sector * 100 + 1,
+                "lSoSecVal": "تولید آهن و فولاد",
+            },
+            "cValMne": f"SYM{ins_code[-4:]}",
+            "lVal18": f"Symbol {ins_code}",
+            "cSocCSAC": f"S{ins_code[-3:]}",
+            "lSoc30": "شرکت نمونه",
+            "yMarNSC": "NO",
+            "yVal": "300",
+            "insCode": ins_code,
+            "lVal30": "شرکت نمونه",
+            "lVal18AFC": f"نماد{ins_code[-4:]}",
+            "flow": 1,
+            "cIsin": f"IRO1{ins_code[-4:]:0>4}0001",
+            "zTitad": float(rng.randint(10**6, 10**10)),
+            "baseVol": rng.randint(1, 10**6),
+            "instrumentID": f"IRO1{ins_code[-4:]:0>4}0009",
+            "cgrValCot": "N1",
+            "cComVal": "1",
+            "lastDate": 0,
+            "sourceID": 0,
+            "flowTitle": "بازار اول (تابلوی اصلی) بورس",
+            "cgrValCotTitle": "بازار اول (تابلوی اصلی) بورس",
+        }
+    }
+
+
+def report_list(date: str, page_number: str, letters: int) -> dict:
+    rng = _seed("report_list", date, page_number)
+    return {
+        "Total": letters * 10,
+        "Page": 10,
+        "Letters": [
+            {
+                "SuperVision": {
+                    "UnderSupervision": 0,
+                    "AdditionalInfo": "",
+                    "Reasons": [],
+                },
+                "TracingNo": rng.randint(10**6, 10**7),
+                "Symbol": "نماد",
+                "CompanyName": "شرکت نمونه",
+                "UnderSupervision": 0,
+                "Title": "صورت وضعیت پورتفوی ماهانه",
+                "LetterCode": "ن-۳۰",
+                "SentDateTime": "۱۴۰۲/۱۱/۰۸ ۱۰:۵۴:۲۹",
+                "PublishDateTime": "۱۴۰۲/۱۱/۰۸ ۱۰:۵۴:۲۹",
+                "HasHtml": True,
+                "IsEstimate": False,
+                "Url": f"/Reports/Decision.aspx?LetterSerial={rng.getrandbits(64):x}",
+                "HasExcel": True,
+                "HasPdf": True,
+                "HasXbrl": False,
+                "HasAttachment": False,
+                "AttachmentUrl": "",
+                "PdfUrl": "DownloadFile.aspx",
+                "ExcelUrl": "https://excel.codal.ir/service/Excel/GetAll/",
+                "XbrlUrl": "",
+                "TedanUrl": "http://www.tedan.ir",
+            }
+            for _ in range(letters)
+        ],
+    }
+
+
+def fund(seo_id: str) -> dict:
+    rng = _seed("fund", seo_id)
+    values = {int: lambda: rng.randint(0, 10**9), float: lambda: rng.random() * 100}
+    values |= {bool: lambda: True, str: lambda: f"value {rng.randint(0, 999)}"}
+    item: dict = {name: values[kind]() for name, kind in FUND_FIELDS.items()}
+    item |= {"regNo": seo_id, "websiteAddress": [f"fund{seo_id}.ir"]}
+    item |= {"fundWatch": None, "mutualFundLicenses": []}
+    return {"status": 200, "message": "", "item": item}
+
+
+def institute_list(institutes: int) -> dict:
+    return {
+        "data": [
+            {
+                "InstituteTypeId": 1,
+                "InstituteType": "پردازش اطلاعات مالی",
+                "InstituteKindId": 3,
+                "InstituteKind": "سهامی خاص",
+                "SEORegisterNo": 10000 + i,
+                "Website": f"https://institute{i}.ir/",
+                "Name": f"موسسه {i}",
+                "NationalId": f"{14000000000 + i}",
+                "CEO": "مدیر عامل",
+                "CEOMobileNo": None,
+                "StateId": None,
+                "State": None,
+                "Id": i,
+            }
+            for i in range(institutes)
+        ],
+        "total": institutes,
+    }
+
+
+def bond_page(record_id: str) -> str:
+    rng = _seed("bond_page", record_id)
+    rows = "".join(
+        f"<tr><td>{title}</td><td>{rng.randint(1, 10**6):,}</td></tr>"
+        for title in IFB_TITLES
+    )
+    return (
+        "<html><body>"
+        f'<table class="insTable">{rows}</table>'
+        '<table id="ContentPlaceHolder1_grdPBs"><tr><th>date</th><th>value</th></tr>'
+        "</table></body></html>"
+    )
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latency: float = 0
+    error_rate: float = 0
+    replay_dir: Path | None = None
+    days: int = 500
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        time.sleep(self.latency)
+        if random.random() < self.error_rate:
+            self._send(503, b"Service Unavailable", "text/plain", {"Retry-After": "0"})
+            return
+        if self.replay_dir is not None:
+            recorded = self.replay_dir.joinpath(recorded_name(self.path))
+            if recorded.exists():
+                self._send(200, recorded.read_bytes(), "application/json")
+                return
+        body = self.synthesize()
+        if body is None:
+            self._send(404, b"Not Found", "text/plain")
+        elif isinstance(body, str):
+            self._send(200, body.encode("utf-8"), "text/html; charset=utf-8")
+        else:
+            content = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self._send(200, content, "application/json; charset=utf-8")
+
+    def synthesize(self) -> dict | str | None:
+        url = urlsplit(self.path)
+        parts = url.path.strip("/").split("/")
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if "GetClosingPriceDailyList" in parts:
+            ins_code = parts[parts.index("GetClosingPriceDailyList") + 1]
+            return closing_prices(ins_code, self.days)
+        if "GetInstrumentIdentity" in parts:
+            return instrument_identity(parts[-1])
+        if url.path.endswith("/api/search/v2/q"):
+            return report_list(query["FromDate"], query["PageNumber"], 20)
+        if url.path.endswith("/fund/getfund"):
+            return fund(query["regno"])
+        if url.path.endswith("/institutes"):
+            return institute_list(int(query.get("limit", 1000)))
+        if url.path.endswith("/InstrumentsMFI.aspx"):
+            return bond_page(query["id"])
+        return None
+
+    def _send(
+        self, status: int, body: bytes, content_type: str, headers: dict | None = None
+    ) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:  # pylint: disable=W0622
+        pass
+
+
+class ReplayServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def create_server(
+    port: int = 0,
+    latency: float = 0,
+    error_rate: float = 0,
+    replay_dir: Path | None = None,
+    days: int = 500,
+) -> ReplayServer:
+    handler = type(
+        "Handler",
+        (ReplayHandler,),
+        {
+            "latency": latency,
+            "error_rate": error_rate,
+            "replay_dir": replay_dir,
+            "days": days,
+        },
+    )
+    return ReplayServer(("127.0.0.1", port), handler)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0, help="seconds")
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--replay-dir", type=Path)
+    parser.add_argument("--days", type=int, default=500, help="prices per symbol")
+    args = parser.parse_args()
+    server = create_server(
+        args.port, args.latency, args.error_rate, args.replay_dir, args.days
+    )
+    print(server.server_address[1], flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,18 @@
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from datetime import date
+from pathlib import Path
 from typing import Literal
 
 import pandas as pd
+import pyarrow as pa
 
 from .metadata_reader import Table, Column, get_metadata
 from . import utils
+from .table_cache import read_table, table_cache
+from .security_index import get_security_index
+from .query import DataQuery, TablePart
+from .panel import Panel, create_panel
 
 from . import tsetmc, ifb
 
@@ -41,11 +49,20 @@ item_aliases = {
 }
 
 
+def _refresh_table(table: Table, update: bool) -> None:
+    if not table.path.exists() or update:
+        if utils.download_file(table.path):
+            table_cache.invalidate(table.path)
+
+
 def load_table(
-    table: Table, columns: list[Column] | None = None, *, update: bool = True
+    table: Table,
+    columns: list[Column] | None = None,
+    *,
+    update: bool = True,
+    filters: list[tuple] | None = None,
 ) -> pd.DataFrame:
-    if not table.path.exists() or update:
-        utils.download_file(table.path)
+    _refresh_table(table, update)
     if columns is not None:
         column_names = []
         for column in columns:
@@ -53,7 +70,7 @@ def load_table(
             column_names.append(column.new_name)
     else:
         column_names = None
-    return pd.read_parquet(table, columns=column_names)
+    return read_table(table.path, column_names, filters).to_pandas()
 
 
 def search_security(dataset: pd.DataFrame, security: str) -> pd.DataFrame:
@@ -65,11 +82,44 @@ def search_security(dataset: pd.DataFrame, security: str) -> pd.DataFrame:
     ]
 
 
+def find_securities(key_table: pd.DataFrame, securities: list[str]) -> pd.DataFrame:
+    index = get_security_index(tables.tsetmc.security_identity, key_table)
+    matches = []
+    for security in securities:
+        positions = index.lookup(security)
+        if positions is None:
+            matches.append(search_security(key_table, security))
+        else:
+            matches.append(key_table.iloc[positions])
+    return pd.concat(matches, ignore_index=True)
+
+
+def _create_filters(
+    table: Table,
+    security_filters: list[tuple],
+    start: str | date | None,
+    end: str | date | None,
+) -> list[tuple] | None:
+    filters = security_filters.copy() if "INS_Code" in table.keys else []
+    date_key = table.date_key
+    for operator, value in ((">=", start), ("<=", end)):
+        if value is None or date_key is None:
+            continue
+        value = pd.Timestamp(value)
+        if date_key == "Date_ID":
+            value = int(value.strftime(r"%Y%m%d"))
+        filters.append((date_key, operator, value))
+    return filters if len(filters) > 0 else None
+
+
 def load_data(
     items: list[Column] | ItamAlias,
     securities: list[str] | str | None = None,
     update: bool = True,
-) -> pd.DataFrame:
+    start: str | date | None = None,
+    end: str | date | None = None,
+    output: Literal["pandas", "arrow", "lazy"] = "pandas",
+) -> pd.DataFrame | pa.Table | DataQuery:
     if securities is None:
         securitie_list = None
     else:
@@ -86,15 +136,6 @@ def load_data(
                 securitie_list.append(security)
             securities.pop(0)
 
-    keys = ["INS_Code", "ISIN", "Farsi_Symbol"]
-    key_table = load_table(tables.tsetmc.security_identity, update=update)[keys]
-    if securitie_list is not None:
-        key_table = pd.concat(
-            [search_security(key_table, security) for security in securitie_list],
-            ignore_index=True,
-        )
-    key_table = key_table.set_index(keys)
-
     columns_to_get = []
     for item in items:
         if item in item_aliases:
@@ -112,10 +153,74 @@ def load_data(
         if column in tables_to_get[column.table]:
             continue
         tables_to_get[column.table].append(column)
-    table_list = [
-        load_table(table, columns, update=update).set_index(table.keys)
-        for table, columns in tables_to_get.items()
-    ]
+
+    keys = ["INS_Code", "ISIN", "Farsi_Symbol"]
+    with ThreadPoolExecutor(max_workers=len(tables_to_get) + 1) as executor:
+        refresh_futures = [
+            executor.submit(_refresh_table, table, update) for table in tables_to_get
+        ]
+        key_table = load_table(tables.tsetmc.security_identity, update=update)[keys]
+        if securitie_list is None:
+            security_filters = []
+        else:
+            key_table = find_securities(key_table, securitie_list)
+            codes = pa.array(key_table["INS_Code"].unique(), pa.string())
+            security_filters = [("INS_Code", "in", codes)]
+        for future in refresh_futures:
+            future.result()
+        if output != "pandas":
+            query = DataQuery(
+                key_table=pa.Table.from_pandas(
+                    key_table,
+                    schema=pa.schema([(key, pa.string()) for key in keys]),
+                    preserve_index=False,
+                ),
+                keys=keys,
+                parts=[
+                    TablePart(
+                        table=table,
+                        columns=[column.new_name for column in columns],
+                        filters=_create_filters(table, security_filters, start, end),
+                    )
+                    for table, columns in tables_to_get.items()
+                ],
+            )
+            return query if output == "lazy" else query.to_arrow()
+        table_futures = {
+            table: executor.submit(
+                load_table,
+                table,
+                columns,
+                update=False,
+                filters=_create_filters(table, security_filters, start, end),
+            )
+            for table, columns in tables_to_get.items()
+        }
+        table_list = [
+            future.result().set_index(table.keys)
+            for table, future in table_futures.items()
+        ]
+
+    key_table = key_table.set_index(keys)
     for table in table_list:
         key_table = key_table.join(table)
     return key_table
+
+
+def load_panel(
+    item: Column | ItamAlias,
+    securities: list[str] | str | None = None,
+    update: bool = True,
+    start: str | date | None = None,
+    end: str | date | None = None,
+    path: Path | None = None,
+) -> Panel:
+    column = item_aliases[item] if item in item_aliases else item
+    assert isinstance(column, Column)
+    date_key = column.table.date_key
+    if date_key is None or "INS_Code" not in column.table.keys:
+        raise ValueError(f"{column.new_name} is not a daily instrument item")
+    table = load_data(
+        [column], securities, update=update, start=start, end=end, output="arrow"
+    )
+    return create_panel(table, column.new_name, date_key, path=path)
@@ -0,0 +1,139 @@
+"""Asyncio fetch engine for data readers, requires `aiohttp`."""
+
+import asyncio
+import contextlib
+import json
+import queue
+import threading
+import time
+from typing import TYPE_CHECKING, Iterator
+
+import aiohttp
+
+from .metadata_reader import lib_settings
+from .metrics import metrics
+from .retry import parse_retry_after
+
+if TYPE_CHECKING:
+    from .datareader import DataReader
+
+_finished = object()
+
+
+async def get(reader: "DataReader", client: aiohttp.ClientSession, **kwargs) -> dict:
+    # pylint: disable=import-outside-toplevel
+    from .datareader import create_response
+
+    for key in reader.table_metadata.api_params:
+        assert key in kwargs
+    url = reader.url_pattern.format(**kwargs)
+    if (cached := reader.cached_response(url)) is not None:
+        metrics.inc("smdir_cache_hits_total", **reader.metric_tags)
+        return reader.process_response(cached)
+    policy = reader.retry_policy
+    for attempt in range(policy.attempts):
+        while (wait_time := reader.circuit_breaker.wait_time()) > 0:
+            await asyncio.sleep(wait_time)
+        if reader.rate_limiter is not None:
+            await reader.rate_limiter.acquire_async()
+        retry_after = None
+        received = False
+        start = time.perf_counter()
+        try:
+            async with client.get(url) as response:
+                content = await response.read()
+                received = True
+                reader.record_request(
+                    response.status, time.perf_counter() - start, content
+                )
+                status = policy.classify(response.status)
+                if status == "fatal":
+                    reader.circuit_breaker.record(
+                        response.status not in policy.blocking_status
+                    )
+                    metrics.inc("smdir_failed_requests_total", **reader.metric_tags)
+                    print(f"Getting data failed for {kwargs}: {response.status}")
+                    return {}
+                if status == "retry":
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    raise aiohttp.ClientResponseError(
+                        response.request_info, (), status=response.status
+                    )
+            response = create_response(url, response.status, content, response.headers)
+            result = reader.process_response(response)
+            reader.cache_response(url, response)
+        except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError):
+            reader.circuit_breaker.record(False)
+            if not received:
+                reader.record_request("error", time.perf_counter() - start, b"")
+            if attempt == policy.attempts - 1:
+                break
+            print(f"Getting data failed for {kwargs}. Retrying ... ({attempt + 1})")
+            metrics.inc("smdir_retries_total", **reader.metric_tags)
+            await asyncio.sleep(policy.delay(attempt, retry_after))
+            continue
+        reader.circuit_breaker.record(True)
+        return result
+    metrics.inc("smdir_failed_requests_total", **reader.metric_tags)
+    return {}
+
+
+async def _fetch_all(
+    reader: "DataReader", keys_list: list[dict], records: queue.Queue, concurrency: int
+) -> None:
+    keys_iterator = iter(keys_list)
+
+    async def worker() -> None:
+        for keys in keys_iterator:
+            result = await get(reader, client, **keys)
+            records.put(reader.create_raw_record(keys, result))
+
+    async with aiohttp.ClientSession(
+        headers=reader.headers,
+        connector=aiohttp.TCPConnector(limit=concurrency),
+        timeout=aiohttp.ClientTimeout(total=100),
+    ) as client:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+def iter_raw_records(
+    reader: "DataReader", keys_list: list[dict], concurrency: int | None = None
+) -> Iterator[dict]:
+    """Fetch `keys_list` with up to `concurrency` requests in flight.
+
+    The event loop runs on its own thread and raw records are yielded in
+    completion order while the remaining requests are still running. Closing
+    the iterator cancels the requests that have not finished.
+    """
+    concurrency = lib_settings.async_concurrency if concurrency is None else concurrency
+    records: queue.Queue = queue.Queue(maxsize=4 * concurrency)
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(_fetch_all(reader, keys_list, records, concurrency))
+
+    def run() -> None:
+        try:
+            loop.run_until_complete(task)
+        except BaseException as error:  # pylint: disable=broad-exception-caught
+            records.put(error)
+        else:
+            records.put(_finished)
+        finally:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while (record := records.get()) is not _finished:
+            if isinstance(record, BaseException):
+                raise record
+            yield record
+    finally:
+        # Stop the requests still running when the consumer goes away
+        if not task.done():
+            with contextlib.suppress(RuntimeError):
+                loop.call_soon_threadsafe(task.cancel)
+        while thread.is_alive():
+            with contextlib.suppress(queue.Empty):
+                records.get(timeout=0.1)
+        thread.join()
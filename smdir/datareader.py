@@ -1,22 +1,91 @@
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import math
 import time
 from datetime import datetime
-import random
 import json
 import itertools
+import random
+import threading
+from typing import Iterator, Literal, Mapping
+from urllib.parse import urlsplit
 
 import requests
+from requests.adapters import HTTPAdapter
 
 # import requests.exceptions
 from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
 import pandas as pd
+import pyarrow as pa
+from pydantic import ValidationError
 
 from . import utils
-from .metadata_reader import Table
+from .dataset import read_dataset
+from .extraction import extract_table, loads
+from .metadata_reader import Table, lib_settings
+from .metrics import metrics
+from .rate_limiter import get_rate_limiter
+from .raw_store import RawStore, payload_hash
+from .response_cache import response_cache
+from .retry import (
+    RetryPolicy,
+    default_retry_policy,
+    get_circuit_breaker,
+    parse_retry_after,
+)
+
+FetchEngine = Literal["thread", "async"]
+ValidationMode = Literal["off", "sampled", "strict"]
+
+
+def create_response(
+    url: str, status_code: int, content: bytes, headers: Mapping[str, str]
+) -> Response:
+    response = Response()
+    response.url = url
+    response.status_code = status_code
+    response.headers = CaseInsensitiveDict(headers)
+    response.encoding = get_encoding_from_headers(response.headers)
+    response._content = content  # pylint: disable=protected-access
+    return response
+
+
+PARSE_SHARD_SIZE = 500
+
+_parse_reader: "DataReader | None" = None
+
+
+def _table_to_ipc(table: pa.Table) -> bytes:
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _table_from_ipc(buffer: bytes) -> pa.Table:
+    return pa.ipc.open_stream(buffer).read_all()
+
+
+def _init_parse_worker(reader: "DataReader") -> None:
+    global _parse_reader  # pylint: disable=global-statement
+    _parse_reader = reader
+
+
+def _parse_shard(buffer: bytes) -> bytes | pd.DataFrame:
+    assert _parse_reader is not None
+    # pylint: disable=protected-access
+    table = _parse_reader._extract_shard(_table_from_ipc(buffer).to_pandas())
+    return _table_to_ipc(table) if isinstance(table, pa.Table) else table
 
 
 class DataReader:
     headers: dict
+    max_workers: int = lib_settings.max_workers
+    validation: ValidationMode = lib_settings.validation  # type: ignore
+    parse_workers: int = lib_settings.parse_workers
+    retry_policy: RetryPolicy = default_retry_policy
+    bypass_cache: bool = False
 
     def __init__(self, url_pattern: str, table_metadata: Table) -> None:
         self.table_metadata = table_metadata
@@ -24,43 +93,120 @@ class DataReader:
             assert f"{{{key}}}" in url_pattern
         self.url_pattern = url_pattern
         self.raw_path = self.table_metadata.raw
+        self.raw_store = RawStore(self.table_metadata)
+        self.host = urlsplit(url_pattern).hostname
+        self.rate_limiter = get_rate_limiter(self.host)
+        self.circuit_breaker = get_circuit_breaker(self.host)
+        self._session: requests.Session | None = None
+        self._session_lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        for name in ("_session", "_session_lock", "rate_limiter", "circuit_breaker"):
+            state.pop(name)
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.rate_limiter = get_rate_limiter(self.host)
+        self.circuit_breaker = get_circuit_breaker(self.host)
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        with self._session_lock:
+            if self._session is None:
+                self._session = self.create_session()
+            return self._session
+
+    def create_session(self) -> requests.Session:
+        session = requests.Session()
+        session.headers.update(self.headers)
+        adapter = HTTPAdapter(
+            pool_connections=4, pool_maxsize=self.max_workers, pool_block=True
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
 
     def get(self, **kwargs) -> dict:
-        retry = 0 if "retry" not in kwargs else kwargs["retry"]
         for key in self.table_metadata.api_params:
             assert key in kwargs
         url = self.url_pattern.format(**kwargs)
-        try:
-            response = requests.get(url=url, headers=self.headers, timeout=100)
-        except requests.exceptions.RequestException:
-            retry += 1
-            print(f"Getting data failed for {kwargs}. Retrying ... ({retry})")
-            if retry < 2:
-                time.sleep(20 + random.random() * 80)
-            else:
-                time.sleep(1)
-            if retry < 5:
-                return self.get(**kwargs)
-            return {}
+        if (response := self.cached_response(url)) is not None:
+            metrics.inc("smdir_cache_hits_total", **self.metric_tags)
+            return self.process_response(response)
+        policy = self.retry_policy
+        for attempt in range(policy.attempts):
+            while (wait_time := self.circuit_breaker.wait_time()) > 0:
+                time.sleep(wait_time)
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            retry_after = None
+            response = None
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url=url, timeout=100)
+                self.record_request(
+                    response.status_code, time.perf_counter() - start, response.content
+                )
+                status = policy.classify(response.status_code)
+                if status == "fatal":
+                    self.circuit_breaker.record(
+                        response.status_code not in policy.blocking_status
+                    )
+                    metrics.inc("smdir_failed_requests_total", **self.metric_tags)
+                    print(f"Getting data failed for {kwargs}: {response.status_code}")
+                    return {}
+                if status == "retry":
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    raise requests.exceptions.HTTPError(response=response)
+                result = self.process_response(response)
+                self.cache_response(url, response)
+            except (json.JSONDecodeError, requests.exceptions.RequestException):
+                self.circuit_breaker.record(False)
+                if response is None:
+                    self.record_request("error", time.perf_counter() - start, b"")
+                if attempt == policy.attempts - 1:
+                    break
+                print(f"Getting data failed for {kwargs}. Retrying ... ({attempt + 1})")
+                metrics.inc("smdir_retries_total", **self.metric_tags)
+                time.sleep(policy.delay(attempt, retry_after))
+                continue
+            self.circuit_breaker.record(True)
+            return result
+        metrics.inc("smdir_failed_requests_total", **self.metric_tags)
+        return {}
+
+    @property
+    def metric_tags(self) -> dict[str, str]:
+        return {"table": self.table_metadata.name, "host": str(self.host)}
+
+    def record_request(self, status: int | str, seconds: float, content: bytes) -> None:
+        metrics.inc("smdir_requests_total", status=status, **self.metric_tags)
+        metrics.observe("smdir_request_seconds", seconds, **self.metric_tags)
+        metrics.inc("smdir_response_bytes_total", len(content), **self.metric_tags)
+
+    @property
+    def cache_ttl(self) -> float:
+        if self.table_metadata.cache_ttl is not None:
+            return self.table_metadata.cache_ttl
+        return lib_settings.response_cache_ttl
+
+    def cached_response(self, url: str) -> Response | None:
+        if self.bypass_cache or self.cache_ttl <= 0:
+            return None
+        return response_cache.get(url, self.cache_ttl)
+
+    def cache_response(self, url: str, response: Response) -> None:
+        if self.cache_ttl > 0:
+            response_cache.put(url, response)
+
+    def process_response(self, response: Response) -> dict:
         if self.table_metadata.is_raw_text:
             return {"text": response.text}
-        try:
-            result = self.parse(response)
-        except (json.JSONDecodeError, requests.exceptions.RequestException):
-            retry += 1
-            print(f"Parsing data failed for {kwargs}. Retrying ... ({retry})")
-            print(response.content)
-            if retry < 2:
-                time.sleep(20 + random.random() * 80)
-            else:
-                time.sleep(1)
-            if retry < 5:
-                return self.get(**kwargs)
-            return {}
-        if self.table_metadata.validator is not None:
-            result = self.table_metadata.validate_input(result)
-        assert isinstance(result, dict)
-        return result
+        return self.parse(response)
 
     @staticmethod
     def parse(response: Response) -> dict:
@@ -68,18 +214,41 @@ class DataReader:
         assert isinstance(result, dict)
         return result
 
+    def create_raw_record(self, keys: dict, result: dict) -> dict:
+        text = json.dumps(result, ensure_ascii=False)
+        return keys | {
+            "JSON": text,
+            "Hash": payload_hash(text),
+            "recived_time": datetime.now(),
+        }
+
     def create_raw_row(self, row: pd.Series = pd.Series()) -> pd.Series:
         keys = row[self.table_metadata.api_params].to_dict()
-        keys.update(
-            {
-                "JSON": json.dumps(self.get(**keys), ensure_ascii=False),
-                "recived_time": datetime.now(),
-            }
-        )
-        return pd.Series(keys)
+        return pd.Series(self.create_raw_record(keys, self.get(**keys)))
+
+    def iter_raw_records(
+        self, key_frame: pd.DataFrame, engine: FetchEngine | None = None
+    ) -> Iterator[dict]:
+        """Fetch every key in `key_frame`, yielding raw records as they arrive."""
+        engine = lib_settings.fetch_engine if engine is None else engine
+        keys_list = key_frame[self.table_metadata.api_params].to_dict("records")
+        if engine == "async":
+            # pylint: disable=import-outside-toplevel
+            from . import async_engine
+
+            yield from async_engine.iter_raw_records(self, keys_list)
+            return
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            yield from executor.map(
+                lambda keys: self.create_raw_record(keys, self.get(**keys)),
+                keys_list,
+            )
 
     def create_raw_table(
-        self, key_frame: pd.DataFrame = pd.DataFrame()
+        self,
+        key_frame: pd.DataFrame = pd.DataFrame(),
+        *,
+        engine: FetchEngine | None = None,
     ) -> pd.DataFrame:
         if key_frame.empty:
             return self.create_raw_row().to_frame().transpose()
@@ -87,31 +256,29 @@ class DataReader:
         key_frame.columns = key_frame.columns.str.lower()
         for key in self.table_metadata.api_params:
             assert key in key_frame.columns
-        number = len(key_frame) // 20 + 1
-        with ThreadPoolExecutor(max_workers=8) as executor:
-            raw_table = pd.concat(
-                executor.map(
-                    lambda df: df.apply(self.create_raw_row, axis=1),
-                    utils.split_dataframe(key_frame, n=number),
-                ),
-                ignore_index=True,
-            )
-        return raw_table
+        return pd.DataFrame.from_records(self.iter_raw_records(key_frame, engine))
 
     def update_raw_table(
-        self, key_frame: pd.DataFrame = pd.DataFrame(), *, ignore_existing=True
+        self,
+        key_frame: pd.DataFrame = pd.DataFrame(),
+        *,
+        ignore_existing=True,
+        engine: FetchEngine | None = None,
+        compact: bool = True,
     ) -> None:
         if key_frame.empty:
-            self._update_raw_table_part(key_frame)
+            self.raw_store.write_segment(self.create_raw_table())
+            if compact:
+                self.raw_store.compact()
             return
 
         params_list = self.table_metadata.api_params
         key_frame = key_frame.copy()
         key_frame.columns = key_frame.columns.str.lower()
         key_frame = key_frame[params_list].drop_duplicates()
-        if ignore_existing and self.raw_path.exists():
+        if ignore_existing and self.raw_store.exists():
             key_frame["ToGet"] = 1
-            existing_keys = pd.read_parquet(self.raw_path, columns=params_list)
+            existing_keys = self.raw_store.read(params_list)
             key_frame = (
                 pd.concat([key_frame, existing_keys])
                 .drop_duplicates(params_list, keep=False)
@@ -121,49 +288,210 @@ class DataReader:
             if len(key_frame.index) == 0:
                 return
         print(f"{len(key_frame)} records to get")
-        number = (len(key_frame) - 1) // 5000 + 1
-        key_frame_parts = utils.split_dataframe(key_frame, number)
-        for part in key_frame_parts:
-            self._update_raw_table_part(part)
+        self.raw_store.start_run(key_frame)
+        self._fetch_raw_records(key_frame, engine)
+        self._finish_raw_run(compact)
 
-    def _update_raw_table_part(self, key_frame: pd.DataFrame) -> None:
-        try:
-            old_table = pd.read_parquet(self.raw_path)
-        except FileNotFoundError:
-            old_table = pd.DataFrame()
-        new_table = self.create_raw_table(key_frame)
-        columns = new_table.columns.to_list()
-        columns.remove("recived_time")
-        table = (
-            pd.concat([old_table, new_table], ignore_index=True)
-            .sort_values("recived_time", ascending=False)
-            .drop_duplicates(columns, keep="last")
-            .reset_index(drop=True)
-        )
-        table.to_parquet(
-            self.raw_path, partition_cols=self.table_metadata.partition, index=False
-        )
+    def resume_raw_table(
+        self, *, engine: FetchEngine | None = None, compact: bool = True
+    ) -> bool:
+        """Continue an interrupted `update_raw_table` run, if there is one."""
+        manifest = self.raw_store.read_manifest()
+        if manifest is None:
+            return False
+        if manifest["status"] == "fetching":
+            key_frame = self.raw_store.pending_run_keys()
+            assert key_frame is not None
+            print(f"{len(key_frame)} records to get")
+            self._fetch_raw_records(key_frame, engine)
+        self._finish_raw_run(compact)
+        return True
 
-    def create_table(self) -> pd.DataFrame:
-        records = pd.read_parquet(self.raw_path).sort_values(
-            "recived_time", ascending=False
+    def _fetch_raw_records(
+        self, key_frame: pd.DataFrame, engine: FetchEngine | None
+    ) -> None:
+        number = (len(key_frame) - 1) // 5000 + 1
+        raw_records = itertools.chain.from_iterable(
+            self.iter_raw_records(part, engine)
+            for part in utils.split_dataframe(key_frame, number)
+            if not part.empty
         )
+        batch = []
+        for raw_record in raw_records:
+            batch.append(raw_record)
+            if len(batch) >= lib_settings.checkpoint_size:
+                self._write_checkpoint(batch)
+                batch = []
+        self._write_checkpoint(batch)
+
+    def _write_checkpoint(self, batch: list[dict]) -> None:
+        path = self.raw_store.write_segment(pd.DataFrame.from_records(batch))
+        self.raw_store.add_run_segment(path, len(batch))
+
+    def _finish_raw_run(self, compact: bool) -> None:
+        if compact:
+            self.raw_store.set_run_status("compacting")
+            self.raw_store.compact()
+        self.raw_store.finish_run()
+
+    def create_table(self, *, incremental: bool = False) -> pd.DataFrame:
+        table = self._create_table(incremental)[0]
+        return self.open_table() if table is None else table
+
+    def _create_table(
+        self, incremental: bool
+    ) -> tuple[pd.DataFrame | None, str | None]:
+        """Build the table from raw rows, returning it with its watermark.
+
+        Incremental builds only parse raw rows stored after the watermark of
+        the current table and merge them into it by `keys`; the table is None
+        when there is nothing new.
+        """
+        watermark = self.read_watermark() if incremental else None
+        filters = None
+        if watermark is not None:
+            filters = [("stored_time", ">", pd.Timestamp(watermark))]
+        records = self.raw_store.read(filters=filters)
+        if watermark is not None and len(records) == 0:
+            return None, watermark
+        new_watermark = records["stored_time"].max().isoformat()
+        records = records.sort_values("recived_time", ascending=False)
         if self.table_metadata.keep_history:
             pass
         elif len(self.table_metadata.api_params) > 0:
             records = records.drop_duplicates(self.table_metadata.api_params)
         else:
             records = records.iloc[:1, :]
-        records = records.apply(self.create_records, axis=1)  # type: ignore
-        records = itertools.chain.from_iterable(records)
-        table = pd.DataFrame.from_records(records)
+        table = self.extract_records(records)
         if self.table_metadata.keep_history:
             table = table.drop_duplicates(table.columns[:-1])
         table = self.table_metadata.post_process(table)
+        if watermark is not None and len(table) > 0:
+            table = pd.concat([self.open_table(), table], ignore_index=True)
+            table = table.drop_duplicates(self.table_metadata.keys, keep="last")
+        elif watermark is not None:
+            return None, new_watermark
+        return table, new_watermark
+
+    def read_watermark(self) -> str | None:
+        """Return the store time of the newest raw rows merged into the table.
+
+        None, meaning a full rebuild, for tables without keys, when the table
+        file was changed by anything but `update_table` or when it was built
+        with another `validation` mode, since only strict validation coerces
+        column types.
+        """
+        if self.table_metadata.keep_history or len(self.table_metadata.keys) == 0:
+            return None
+        metadata = utils.read_file_metadata(self.table_metadata.path, "build")
+        if metadata is None or metadata.get("validation") != self.validation:
+            return None
+        return metadata.get("stored_time")
+
+    def extract_records(self, records: pd.DataFrame) -> pd.DataFrame:
+        with metrics.timer("smdir_parse_seconds", table=self.table_metadata.name):
+            if self.parse_workers > 1 and len(records.index) > 2 * PARSE_SHARD_SIZE:
+                table = self._extract_records_parallel(records)
+            else:
+                table = self._extract_shard(records)
+            if isinstance(table, pa.Table):
+                table = table.to_pandas()
+        metrics.inc(
+            "smdir_records_total", len(table.index), table=self.table_metadata.name
+        )
         return table
 
+    def _extract_shard(self, records: pd.DataFrame) -> pa.Table | pd.DataFrame:
+        payloads = self.validate_payloads([loads(text) for text in records["JSON"]])
+        try:
+            return extract_table(records, payloads, self.table_metadata)
+        except (pa.ArrowException, KeyError, TypeError, IndexError):
+            rows = (row for _, row in records.iterrows())
+            records = map(self._create_records, rows, payloads)
+            return pd.DataFrame.from_records(itertools.chain.from_iterable(records))
+
+    def _extract_records_parallel(self, records: pd.DataFrame) -> pd.DataFrame:
+        """Parse shards of raw rows in worker processes, keeping their order.
+
+        Shards travel as Arrow IPC streams and come back as Arrow tables, or as
+        data frames when a shard had to use the row path.
+        """
+        columns = self.table_metadata.api_params + ["JSON", "recived_time"]
+        records = records[columns].reset_index(drop=True)
+        shard_size = max(
+            PARSE_SHARD_SIZE, math.ceil(len(records.index) / (self.parse_workers * 4))
+        )
+        shards = (
+            _table_to_ipc(
+                pa.Table.from_pandas(
+                    records.iloc[start : start + shard_size], preserve_index=False
+                )
+            )
+            for start in range(0, len(records.index), shard_size)
+        )
+        with ProcessPoolExecutor(
+            self.parse_workers, initializer=_init_parse_worker, initargs=(self,)
+        ) as executor:
+            parts = [
+                _table_from_ipc(part) if isinstance(part, bytes) else part
+                for part in executor.map(_parse_shard, shards)
+            ]
+        if all(isinstance(part, pa.Table) for part in parts):
+            try:
+                return pa.concat_tables(parts, promote_options="default").to_pandas()
+            except pa.ArrowInvalid:
+                pass
+        parts = [
+            part.to_pandas() if isinstance(part, pa.Table) else part for part in parts
+        ]
+        return pd.concat(parts, ignore_index=True)
+
+    def validate_payloads(self, payloads: list[dict]) -> list[dict]:
+        """Validate payloads in one batch according to `validation`.
+
+        Strict mode returns the payloads as dumped by the validator; sampled
+        mode only checks a random share of them and keeps the payloads as is.
+        Invalid payloads are replaced by `{}`, like a failed fetch.
+        """
+        if self.table_metadata.validator is None or self.validation == "off":
+            return payloads
+        with metrics.timer(
+            "smdir_validation_seconds",
+            table=self.table_metadata.name,
+            mode=self.validation,
+        ):
+            return self._validate_payloads(payloads)
+
+    def _validate_payloads(self, payloads: list[dict]) -> list[dict]:
+        positions = [i for i, data in enumerate(payloads) if data != {}]
+        if self.validation == "sampled":
+            size = round(len(positions) * lib_settings.validation_sample_rate)
+            positions = random.sample(positions, min(len(positions), max(size, 1)))
+        try:
+            validated = self.table_metadata.validate_payloads(
+                [payloads[i] for i in positions]
+            )
+        except ValidationError:
+            validated = [self._validate_payload(payloads[i]) for i in positions]
+        payloads = payloads.copy()
+        for position, data in zip(positions, validated):
+            if self.validation == "strict" or data == {}:
+                payloads[position] = data
+        return payloads
+
+    def _validate_payload(self, data: dict) -> dict:
+        """Validate a single payload, turning an invalid one into a failed fetch."""
+        try:
+            return self.table_metadata.validate_payloads([data])[0]
+        except ValidationError as error:
+            print(f"Invalid payload in {self.table_metadata.name}: {error}")
+            metrics.inc("smdir_invalid_payloads_total", table=self.table_metadata.name)
+            return {}
+
     def create_records(self, row: pd.Series) -> list[dict]:
-        data = json.loads(row["JSON"])
+        return self._create_records(row, loads(row["JSON"]))
+
+    def _create_records(self, row: pd.Series, data: dict) -> list[dict]:
         if data == {}:
             return []
         api_params = row[self.table_metadata.api_params].to_dict()
@@ -180,21 +508,45 @@ class DataReader:
         return records
 
     def _create_record(self, raw_record: dict) -> dict:
-        record = {}
-        for name, original_name in self.table_metadata.get_columns().items():
-            value = raw_record
-            for key in original_name:
-                try:
-                    value = value[key]
-                except IndexError:
-                    value = None
-                    break
-            record[name] = value
-        return record
+        return self.table_metadata.extraction_plan(raw_record)
+
+    def update_table(self, *, incremental: bool = False) -> None:
+        """Rebuild the table file, or with `incremental` merge new raw rows."""
+        table, watermark = self._create_table(incremental)
+        if table is not None:
+            table = self.sort_table(table)
+            with metrics.timer(
+                "smdir_write_seconds", table=self.table_metadata.name, target="table"
+            ):
+                table.to_parquet(
+                    self.table_metadata.path,
+                    index=False,
+                    row_group_size=lib_settings.row_group_size,
+                    write_statistics=True,
+                )
+        if watermark is not None:
+            utils.write_file_metadata(
+                self.table_metadata.path,
+                {"stored_time": watermark, "validation": self.validation},
+                "build",
+            )
 
-    def update_table(self) -> None:
-        table = self.create_table()
-        table.to_parquet(self.table_metadata.path, index=False)
+    def sort_table(self, table: pd.DataFrame) -> pd.DataFrame:
+        keys = self.table_metadata.keys
+        date_key = self.table_metadata.date_key
+        if len(keys) == 0:
+            return table
+        if date_key is None:
+            return table.sort_values(keys, ignore_index=True)
+        if date_key == "Date_ID":
+            year = table[date_key] // 10000
+        else:
+            year = table[date_key].dt.year
+        return (
+            table.assign(_year=year)
+            .sort_values(["_year"] + keys, ignore_index=True)
+            .drop(columns="_year")
+        )
 
     def open_table(self) -> pd.DataFrame:
-        return pd.read_parquet(self.table_metadata.path)
+        return read_dataset(self.table_metadata.path).to_pandas()
@@ -0,0 +1,51 @@
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
+
+from .metadata_reader import lib_settings
+
+_filesystem = fs.LocalFileSystem(use_mmap=True)
+_partitioning = ds.HivePartitioning.discover(infer_dictionary=True)
+
+
+def open_dataset(path: Path) -> ds.Dataset:
+    """Open a table file, or a hive partitioned table directory, memory mapped."""
+    return ds.dataset(
+        str(path.absolute()),
+        format="parquet",
+        partitioning=_partitioning if path.is_dir() else None,
+        filesystem=_filesystem,
+    )
+
+
+def read_dataset(
+    path: Path, columns: list[str] | None = None, filters: list[tuple] | None = None
+) -> pa.Table:
+    expression = None if filters is None else pq.filters_to_expression(filters)
+    return open_dataset(path).to_table(columns=columns, filter=expression)
+
+
+def list_tables() -> list[str]:
+    data_dir = lib_settings.data_dir
+    names = []
+    for path in sorted(data_dir.rglob("*.parquet")):
+        parts = path.relative_to(data_dir).parts
+        if any(part.endswith(".parquet") for part in parts[:-1]):
+            continue
+        if any(part.startswith((".", "_")) for part in parts):
+            continue
+        if any(part.endswith("_raw_segments") for part in parts):
+            continue
+        names.append(path.relative_to(data_dir).with_suffix("").as_posix())
+    return names
+
+
+def open_table(name: str) -> ds.Dataset:
+    """Open a table by its name relative to the data directory.
+
+    e.g. `open_table("tsetmc/daily_closing_price")`
+    """
+    return open_dataset(lib_settings.data_dir.joinpath(f"{name}.parquet"))
@@ -0,0 +1,71 @@
+import json
+from typing import Any
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from .metadata_reader import Table
+
+
+def loads(text: str | bytes) -> Any:
+    if orjson is None:
+        return json.loads(text)
+    return orjson.loads(text)
+
+
+def _select(array: pa.Array, key: str | int) -> pa.Array:
+    if isinstance(key, str):
+        if not pa.types.is_struct(array.type):
+            raise TypeError(f"cannot select {key!r} from {array.type}")
+        if array.type.get_field_index(key) == -1:
+            raise KeyError(key)
+        return pc.struct_field(array, [key])
+    if pa.types.is_null(array.type):
+        return array
+    if not pa.types.is_list(array.type):
+        raise TypeError(f"cannot select {key!r} from {array.type}")
+    in_range = pc.greater(pc.list_value_length(array), key)
+    array = pc.if_else(in_range, array, pa.scalar(None, array.type))
+    return pc.list_element(array, key)
+
+
+def extract_table(
+    records: pd.DataFrame, payloads: list, table_metadata: Table
+) -> pa.Table:
+    """Expand raw rows and their parsed payloads into an Arrow table.
+
+    Records of all payloads are converted to a single struct array, so every
+    `Column.address` is sliced out by Arrow rather than record by record.
+    Raises Arrow errors when the payloads do not share a consistent schema.
+    """
+    items: list = []
+    owners: list[int] = []
+    for position, data in enumerate(payloads):
+        if data == {}:
+            continue
+        for address_part in table_metadata.records_address:
+            data = data[address_part]
+        if isinstance(data, dict):
+            data = [data]
+        items.extend(data)
+        owners.extend([position] * len(data))
+    raw_records = pa.array(items)
+    owners_array = pa.array(owners, type=pa.int64())
+    columns = {}
+    for name in table_metadata.api_params:
+        columns[name] = pa.Array.from_pandas(records[name]).take(owners_array)
+    for name, address in table_metadata.extraction_plan.columns.items():
+        column = raw_records
+        for key in address:
+            column = _select(column, key)
+        columns[name] = column
+    columns["recived_time"] = pa.Array.from_pandas(records["recived_time"]).take(
+        owners_array
+    )
+    return pa.table(columns)
@@ -1,3 +1,5 @@
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 
 from ..metadata_reader import lib_settings, Table, Column
@@ -139,14 +141,22 @@ def extract_data_from_pages() -> tuple[pd.DataFrame, pd.DataFrame]:
         .drop_duplicates("IFB_ID", keep="first")
     )
     payment_dict = {}
-    info_dict = {}
 
     for _, row in bond_page.iterrows():
         if row["payment_table"]["date"] is None:
             pass
         else:
             payment_dict[row["IFB_ID"]] = pd.DataFrame(row["payment_table"])
-        info_dict[row["IFB_ID"]] = extract_page_data(row["page"])
+    pages = bond_page["page"].to_list()
+    if lib_settings.parse_workers > 1:
+        with ProcessPoolExecutor(lib_settings.parse_workers) as executor:
+            chunksize = max(1, len(pages) // (lib_settings.parse_workers * 4))
+            page_data = list(
+                executor.map(extract_page_data, pages, chunksize=chunksize)
+            )
+    else:
+        page_data = list(map(extract_page_data, pages))
+    info_dict = dict(zip(bond_page["IFB_ID"], page_data))
 
     payment_table = (
         pd.concat(payment_dict, names=["IFB_ID", "index"])
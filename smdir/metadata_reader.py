@@ -1,9 +1,11 @@
+from functools import cached_property
+import operator
 from pathlib import Path
-from typing import Callable
+from typing import Any, Callable
 import inspect
 
 import pandas as pd
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
 import yaml
 
 package_dir = Path(__file__).parent
@@ -52,6 +54,21 @@ class Settings(BaseModel):
     package_name: str = settings_dict["package_name"]
     bucket_address: str = settings_dict["bucket_address"]
     online_dir: str = f"{bucket_address}/{package_name}"
+    download_ttl: float = settings_dict["download_ttl"]
+    table_cache_size: int = settings_dict["table_cache_size"]
+    row_group_size: int = settings_dict["row_group_size"]
+    max_workers: int = settings_dict["max_workers"]
+    response_cache_ttl: float = settings_dict["response_cache_ttl"]
+    response_cache_size: int = settings_dict["response_cache_size"]
+    fetch_engine: str = settings_dict["fetch_engine"]
+    async_concurrency: int = settings_dict["async_concurrency"]
+    rate_limits: dict[str, dict[str, float]] = settings_dict["rate_limits"]
+    retry: dict = settings_dict["retry"]
+    circuit_breaker: dict = settings_dict["circuit_breaker"]
+    checkpoint_size: int = settings_dict["checkpoint_size"]
+    validation: str = settings_dict["validation"]
+    validation_sample_rate: float = settings_dict["validation_sample_rate"]
+    parse_workers: int = settings_dict["parse_workers"]
 
 
 lib_settings = Settings()
@@ -67,6 +84,7 @@ class Table:
     validator: Callable | None = None
     keep_history: bool = False
     is_raw_text: bool = False
+    cache_ttl: float | None = None
 
     def __init__(self) -> None:
         if not self.directory.exists():
@@ -77,10 +95,27 @@ class Table:
     def __fspath__(self) -> str:
         return self.path.__fspath__()
 
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state.pop("extraction_plan", None)
+        state.pop("payloads_adapter", None)
+        return state
+
     @property
     def raw(self) -> Path:
         return self.path.parent.joinpath(self.path.stem + "_raw" + self.path.suffix)
 
+    @property
+    def raw_segments(self) -> Path:
+        return self.path.parent.joinpath(self.path.stem + "_raw_segments")
+
+    @property
+    def date_key(self) -> str | None:
+        for key in ("Date_ID", "Date"):
+            if key in self.keys:
+                return key
+        return None
+
     @classmethod
     def set_table_in_columns(cls, self) -> None:
         for key, value in cls.__dict__.items():
@@ -97,12 +132,26 @@ class Table:
             if isinstance(value, Column) and value.address is not None
         }
 
+    @cached_property
+    def extraction_plan(self) -> "ExtractionPlan":
+        return ExtractionPlan(self.get_columns())
+
+    @cached_property
+    def payloads_adapter(self) -> TypeAdapter:
+        return TypeAdapter(list[self.validator])  # type: ignore
+
     def validate_input(self, _input: dict) -> dict:
         if self.validator is None:
             raise ValueError
         # pylint: disable=not-callable
         return self.validator(**_input).model_dump()
 
+    def validate_payloads(self, payloads: list[dict]) -> list[dict]:
+        if self.validator is None:
+            raise ValueError
+        adapter = self.payloads_adapter
+        return adapter.dump_python(adapter.validate_python(payloads))
+
     def post_process(self, table: pd.DataFrame) -> pd.DataFrame:
         return table
 
@@ -124,3 +173,56 @@ class Column:
             self.address = address
         else:
             raise ValueError
+
+
+def _compile_getter(address: tuple[str | int, ...] | list[str | int]) -> Callable:
+    if any(isinstance(key, int) for key in address):
+
+        def get_indexed(value: Any) -> Any:
+            for key in address:
+                try:
+                    value = value[key]
+                except IndexError:
+                    return None
+            return value
+
+        return get_indexed
+    if len(address) == 1:
+        return operator.itemgetter(address[0])
+    if len(address) == 2:
+        first, second = address
+        return lambda value: value[first][second]
+
+    def get_nested(value: Any) -> Any:
+        for key in address:
+            value = value[key]
+        return value
+
+    return get_nested
+
+
+class ExtractionPlan:
+    """Table columns compiled once into getters for raw records.
+
+    Addresses containing list indexes return None past the end of the list.
+    """
+
+    def __init__(self, columns: dict[str, tuple[str | int, ...]]) -> None:
+        self.columns = columns
+        self.names = tuple(columns)
+        flat_keys = []
+        self.nested = []
+        for position, address in enumerate(columns.values()):
+            if len(address) == 1 and isinstance(address[0], str):
+                flat_keys.append(address[0])
+            else:
+                self.nested.append((position, _compile_getter(address)))
+        self.get_flat = operator.itemgetter(*flat_keys) if flat_keys else None
+        if len(flat_keys) == 1:
+            self.get_flat = lambda raw_record: (raw_record[flat_keys[0]],)
+
+    def __call__(self, raw_record: dict) -> dict:
+        values = [] if self.get_flat is None else list(self.get_flat(raw_record))
+        for position, get in self.nested:
+            values.insert(position, get(raw_record))
+        return dict(zip(self.names, values))
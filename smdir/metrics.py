@@ -0,0 +1,152 @@
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+import bisect
+import json
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Iterator
+
+Labels = tuple[tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)  # fmt: skip
+
+
+@dataclass
+class Histogram:
+    buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    counts: list[int] = field(default_factory=list)
+    count: int = 0
+    sum: float = 0
+
+    def __post_init__(self) -> None:
+        self.counts = [0] * len(self.buckets)
+
+    def observe(self, value: float) -> None:
+        position = bisect.bisect_left(self.buckets, value)
+        if position < len(self.buckets):
+            self.counts[position] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self) -> list[int]:
+        counts, total = [], 0
+        for count in self.counts:
+            total += count
+            counts.append(total)
+        return counts
+
+
+def _labels(labels: dict[str, object]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _format_labels(labels: Labels, extra: Labels = ()) -> str:
+    pairs = [f'{key}="{_escape(value)}"' for key, value in labels + extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class MetricsRegistry:
+    """Thread safe counters and histograms, tagged by labels.
+
+    The report can be exported as JSON or in the Prometheus text format.
+    """
+
+    def __init__(self) -> None:
+        self._counters: dict[tuple[str, Labels], float] = {}
+        self._histograms: dict[tuple[str, Labels], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels: object) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: object) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = Histogram()
+            self._histograms[key].observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels: object) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def report(self) -> dict:
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+            histograms = [
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "buckets": dict(
+                        zip(map(str, histogram.buckets), histogram.cumulative_counts())
+                    ),
+                }
+                for (name, labels), histogram in sorted(self._histograms.items())
+            ]
+        return {"counters": counters, "histograms": histograms}
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            names = sorted({name for name, _ in self._counters})
+            for metric_name in names:
+                lines.append(f"# TYPE {metric_name} counter")
+                for (name, labels), value in sorted(self._counters.items()):
+                    if name == metric_name:
+                        lines.append(f"{name}{_format_labels(labels)} {value}")
+            names = sorted({name for name, _ in self._histograms})
+            for metric_name in names:
+                lines.append(f"# TYPE {metric_name} histogram")
+                for (name, labels), histogram in sorted(self._histograms.items()):
+                    if name != metric_name:
+                        continue
+                    bounds = list(map(str, histogram.buckets)) + ["+Inf"]
+                    counts = histogram.cumulative_counts() + [histogram.count]
+                    for bound, count in zip(bounds, counts):
+                        bucket_labels = _format_labels(labels, (("le", bound),))
+                        lines.append(f"{name}_bucket{bucket_labels} {count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                    lines.append(
+                        f"{name}_count{_format_labels(labels)} {histogram.count}"
+                    )
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path: Path) -> None:
+        self._write(path, json.dumps(self.report(), indent=2))
+
+    def write_prometheus(self, path: Path) -> None:
+        self._write(path, self.to_prometheus())
+
+    @staticmethod
+    def _write(path: Path, text: str) -> None:
+        path = Path(path)
+        temp_path = path.with_name(f".{path.name}")
+        temp_path.write_text(text, encoding="utf-8")
+        os.replace(temp_path, path)
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,89 @@
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+
+@dataclass
+class Panel:
+    """Date by instrument matrix of a single item.
+
+    `values[i, j]` is the value on `dates[i]` for `instruments[j]`, NaN where
+    the instrument has no record.
+    """
+
+    values: np.ndarray
+    dates: pd.DatetimeIndex
+    instruments: pd.CategoricalIndex
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.values, index=self.dates, columns=self.instruments)
+
+    def save(self, path: Path) -> None:
+        np.save(path, self.values)
+        _save_axes(path, self.dates, self.instruments)
+
+    @classmethod
+    def load(cls, path: Path, mmap_mode: str | None = "r") -> "Panel":
+        values = np.load(path, mmap_mode=mmap_mode)  # type: ignore
+        dates = pd.DatetimeIndex(np.load(_axis_path(path, "dates")))
+        instruments = pd.CategoricalIndex(
+            np.load(_axis_path(path, "instruments")), ordered=True
+        )
+        return cls(values=values, dates=dates, instruments=instruments)
+
+
+def _axis_path(path: Path, axis: str) -> Path:
+    return path.with_name(f"{path.stem}_{axis}.npy")
+
+
+def _save_axes(
+    path: Path, dates: pd.DatetimeIndex, instruments: pd.CategoricalIndex
+) -> None:
+    np.save(_axis_path(path, "dates"), dates.to_numpy())
+    np.save(_axis_path(path, "instruments"), instruments.to_numpy(str))
+
+
+def create_panel(
+    table: pa.Table,
+    value_column: str,
+    date_key: str,
+    *,
+    path: Path | None = None,
+    dtype: type = np.float32,
+) -> Panel:
+    """Scatter a long `INS_Code, date_key, value_column` table into a Panel.
+
+    With `path` the matrix is written to an `.npy` file and returned memory
+    mapped, so it can be shared between processes.
+    """
+    instruments = pd.Categorical(
+        table.column("INS_Code").to_numpy(zero_copy_only=False)
+    )
+    table = table.append_column("_instrument", pa.array(instruments.codes))
+    table = table.filter(table.column(date_key).is_valid())
+    dates, date_positions = np.unique(
+        table.column(date_key).to_numpy(), return_inverse=True
+    )
+    if date_key == "Date_ID":
+        dates = pd.to_datetime(dates.astype(str), format=r"%Y%m%d")
+    shape = (len(dates), len(instruments.categories))
+    if path is None:
+        values = np.full(shape, np.nan, dtype=dtype)
+    else:
+        values = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+        values[:] = np.nan
+    column_values = table.column(value_column).to_numpy(zero_copy_only=False)
+    values[date_positions, table.column("_instrument").to_numpy()] = column_values
+    panel = Panel(
+        values=values,
+        dates=pd.DatetimeIndex(dates),
+        instruments=pd.CategoricalIndex(instruments.categories, ordered=True),
+    )
+    if path is not None:
+        values.flush()  # type: ignore
+        _save_axes(path, panel.dates, panel.instruments)
+        panel = Panel.load(path)
+    return panel
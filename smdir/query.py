@@ -0,0 +1,83 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from .metadata_reader import Table
+from .table_cache import read_table
+
+
+@dataclass(frozen=True)
+class TablePart:
+    table: Table
+    columns: list[str]
+    filters: list[tuple] | None = None
+
+
+@dataclass(frozen=True)
+class DataQuery:
+    """Deferred `load_data` result.
+
+    Reads, joins, filtering and projection all run in Arrow when the query
+    is collected; nothing is read before that.
+    """
+
+    key_table: pa.Table
+    keys: list[str]
+    parts: list[TablePart]
+    expressions: list[pc.Expression] = field(default_factory=list)
+    columns: list[str] | None = None
+
+    def filter(self, expression: pc.Expression) -> "DataQuery":
+        return replace(self, expressions=self.expressions + [expression])
+
+    def select(self, columns: list[str]) -> "DataQuery":
+        return replace(self, columns=columns)
+
+    @property
+    def index_columns(self) -> list[str]:
+        index_columns = self.keys.copy()
+        for part in self.parts:
+            for key in part.table.keys:
+                if key not in index_columns:
+                    index_columns.append(key)
+        return index_columns
+
+    def to_arrow(self) -> pa.Table:
+        with ThreadPoolExecutor(max_workers=max(len(self.parts), 1)) as executor:
+            part_tables = list(
+                executor.map(
+                    lambda part: read_table(
+                        part.table.path, part.columns, part.filters
+                    ),
+                    self.parts,
+                )
+            )
+        result = self.key_table
+        for part, part_table in zip(self.parts, part_tables):
+            join_keys = [key for key in part.table.keys if key in result.column_names]
+            result = result.join(
+                part_table,
+                keys=join_keys,
+                join_type="left outer",
+                right_suffix=f"_{part.table.name}",
+            )
+        for expression in self.expressions:
+            result = result.filter(expression)
+        if self.columns is not None:
+            index_columns = [
+                column
+                for column in self.index_columns
+                if column not in self.columns and column in result.column_names
+            ]
+            result = result.select(index_columns + self.columns)
+        return result
+
+    def to_pandas(self) -> pd.DataFrame:
+        table = self.to_arrow()
+        index_columns = [
+            column for column in self.index_columns if column in table.column_names
+        ]
+        return table.to_pandas(types_mapper=pd.ArrowDtype).set_index(index_columns)
@@ -0,0 +1,53 @@
+import asyncio
+import threading
+import time
+
+from .metadata_reader import lib_settings
+
+
+class TokenBucket:
+    """Thread safe token bucket allowing `rate` requests per second.
+
+    Callers reserve a token and wait until it is due, so concurrent callers
+    are spaced evenly instead of retrying in bursts.
+    """
+
+    def __init__(self, rate: float, burst: float = 1) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token and return the seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+    def acquire(self) -> None:
+        time.sleep(self.reserve())
+
+    async def acquire_async(self) -> None:
+        await asyncio.sleep(self.reserve())
+
+
+_rate_limiters: dict[str, TokenBucket] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(host: str | None) -> TokenBucket | None:
+    """Return the bucket shared by every reader of `host`, if it is limited."""
+    if host not in lib_settings.rate_limits:
+        return None
+    with _rate_limiters_lock:
+        if host not in _rate_limiters:
+            _rate_limiters[host] = TokenBucket(**lib_settings.rate_limits[host])
+        return _rate_limiters[host]
@@ -0,0 +1,214 @@
+from datetime import datetime
+import hashlib
+from pathlib import Path
+import json
+import os
+import shutil
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .dataset import open_dataset, read_dataset
+from .metadata_reader import Table
+from .metrics import metrics
+
+
+HASH_SIZE = 16
+
+
+def payload_hash(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=HASH_SIZE).digest()
+
+
+def _legacy_filters(path: Path, filters: list[tuple] | None) -> list[tuple] | None:
+    """Filter files written before `stored_time` on `recived_time` instead."""
+    if filters is None or "stored_time" in open_dataset(path).schema.names:
+        return filters
+    return [
+        ("recived_time" if column == "stored_time" else column, operator, value)
+        for column, operator, value in filters
+    ]
+
+
+class RawStore:
+    """Raw responses of a table, kept as a compacted file plus new segments.
+
+    Every fetched batch is written as a new immutable segment file, so
+    appending never rewrites existing data. `compact` merges the segments
+    into the compacted raw table and removes them.
+
+    Files are zstd compressed and carry a fixed-width `Hash` of each `JSON`
+    payload, used instead of the payload itself to find duplicates. Rows are
+    stamped with the `stored_time` their segment was written at, which only
+    grows from one segment to the next, unlike `recived_time`.
+    """
+
+    def __init__(self, table_metadata: Table) -> None:
+        self.table_metadata = table_metadata
+        self.path = table_metadata.raw
+        self.segments_dir = table_metadata.raw_segments
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.segments_dir.joinpath("run.json")
+
+    @property
+    def run_keys_path(self) -> Path:
+        # "raw" in the name keeps maintainer.update_files from uploading it
+        return self.segments_dir.joinpath("run_raw_keys.parquet")
+
+    def segment_paths(self) -> list[Path]:
+        if not self.segments_dir.exists():
+            return []
+        return sorted(self.segments_dir.glob("raw-*.parquet"))
+
+    def exists(self) -> bool:
+        return self.path.exists() or len(self.segment_paths()) > 0
+
+    def write_segment(self, table: pd.DataFrame) -> Path | None:
+        if table.empty:
+            return None
+        self.segments_dir.mkdir(parents=True, exist_ok=True)
+        name = f"raw-{datetime.now():%Y%m%d%H%M%S%f}-{uuid.uuid4().hex[:8]}.parquet"
+        path = self.segments_dir.joinpath(name)
+        temp_path = self.segments_dir.joinpath(f".{name}")
+        table = table.assign(stored_time=datetime.now())
+        with metrics.timer(
+            "smdir_write_seconds", table=self.table_metadata.name, target="segment"
+        ):
+            pq.write_table(self._to_arrow(table), temp_path, compression="zstd")
+        os.replace(temp_path, path)
+        return path
+
+    def read(
+        self,
+        columns: list[str] | None = None,
+        segment_paths: list[Path] | None = None,
+        filters: list[tuple] | None = None,
+    ) -> pd.DataFrame:
+        segment_paths = self.segment_paths() if segment_paths is None else segment_paths
+        if self.path.exists():
+            segment_paths = [self.path] + segment_paths
+        if len(segment_paths) == 0:
+            raise FileNotFoundError(self.path)
+        tables = []
+        for path in segment_paths:
+            table = read_dataset(path, columns, _legacy_filters(path, filters))
+            table = table.to_pandas()
+            if columns is None and "Hash" not in table.columns:
+                table["Hash"] = table["JSON"].map(payload_hash)
+            if columns is None and "stored_time" not in table.columns:
+                table["stored_time"] = table["recived_time"]
+            tables.append(table)
+        tables = [table for table in tables if len(table.index) > 0] or tables[:1]
+        return pd.concat(tables, ignore_index=True)
+
+    def compact(self) -> None:
+        segment_paths = self.segment_paths()
+        if len(segment_paths) == 0:
+            return
+        table = self.read(segment_paths=segment_paths)
+        columns = self.table_metadata.api_params + ["Hash"]
+        table = (
+            table.sort_values("recived_time", ascending=False)
+            .drop_duplicates(columns, keep="last")
+            .reset_index(drop=True)
+        )
+        temp_path = self.path.with_name(f".{self.path.name}")
+        with metrics.timer(
+            "smdir_write_seconds", table=self.table_metadata.name, target="raw"
+        ):
+            if self.table_metadata.partition is None:
+                pq.write_table(self._to_arrow(table), temp_path, compression="zstd")
+            else:
+                pq.write_to_dataset(
+                    self._to_arrow(table),
+                    temp_path,
+                    partition_cols=self.table_metadata.partition,
+                    compression="zstd",
+                )
+        if self.path.is_dir():
+            shutil.rmtree(self.path)
+        os.replace(temp_path, self.path)
+        for path in segment_paths:
+            path.unlink()
+
+    @staticmethod
+    def _to_arrow(table: pd.DataFrame) -> pa.Table:
+        if "Hash" not in table.columns:
+            table = table.assign(Hash=table["JSON"].map(payload_hash))
+        arrow_table = pa.Table.from_pandas(table, preserve_index=False)
+        position = arrow_table.schema.get_field_index("Hash")
+        hashes = arrow_table["Hash"].cast(pa.binary(HASH_SIZE))
+        return arrow_table.set_column(position, "Hash", hashes)
+
+    def start_run(self, key_frame: pd.DataFrame) -> None:
+        """Record the keys of an update run so it can be resumed."""
+        self.segments_dir.mkdir(parents=True, exist_ok=True)
+        key_frame.to_parquet(self.run_keys_path, index=False)
+        self._write_manifest(
+            {
+                "started": datetime.now().isoformat(),
+                "status": "fetching",
+                "keys": len(key_frame.index),
+                "fetched": 0,
+                "segments": [],
+            }
+        )
+
+    def add_run_segment(self, path: Path | None, records: int) -> None:
+        manifest = self.read_manifest()
+        if manifest is None or path is None:
+            return
+        manifest["fetched"] += records
+        manifest["segments"].append(path.name)
+        self._write_manifest(manifest)
+
+    def set_run_status(self, status: str) -> None:
+        manifest = self.read_manifest()
+        if manifest is None:
+            return
+        manifest["status"] = status
+        self._write_manifest(manifest)
+
+    def finish_run(self) -> None:
+        self.manifest_path.unlink(missing_ok=True)
+        self.run_keys_path.unlink(missing_ok=True)
+
+    def read_manifest(self) -> dict | None:
+        try:
+            with self.manifest_path.open(encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def pending_run_keys(self) -> pd.DataFrame | None:
+        """Keys of the interrupted run that have no checkpointed response yet."""
+        manifest = self.read_manifest()
+        if manifest is None:
+            return None
+        key_frame = pd.read_parquet(self.run_keys_path)
+        params_list = key_frame.columns.to_list()
+        segment_paths = [
+            path
+            for path in map(self.segments_dir.joinpath, manifest["segments"])
+            if path.exists()
+        ]
+        if len(segment_paths) == 0:
+            return key_frame
+        fetched_keys = pd.concat(
+            [read_dataset(path, params_list).to_pandas() for path in segment_paths]
+        )
+        return (
+            key_frame.merge(fetched_keys, how="left", indicator=True)
+            .loc[lambda df: df["_merge"] == "left_only", params_list]
+            .reset_index(drop=True)
+        )
+
+    def _write_manifest(self, manifest: dict) -> None:
+        temp_path = self.manifest_path.with_name(f".{self.manifest_path.name}")
+        with temp_path.open(mode="w", encoding="utf-8") as file:
+            json.dump(manifest, file)
+        os.replace(temp_path, self.manifest_path)
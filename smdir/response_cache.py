@@ -0,0 +1,101 @@
+from hashlib import sha256
+import os
+from pathlib import Path
+import pickle
+import threading
+import time
+import uuid
+
+from requests.models import Response
+
+from .metadata_reader import lib_settings
+
+
+class ResponseCache:
+    """On-disk cache of successful responses keyed by URL.
+
+    Entries older than the TTL given to `get` are misses. When the cache grows
+    past `max_bytes`, the least recently used entries are removed.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._current_bytes: int | None = None
+        self._lock = threading.Lock()
+
+    def _path(self, url: str) -> Path:
+        return self.directory.joinpath(f"{sha256(url.encode()).hexdigest()}.pickle")
+
+    def get(self, url: str, ttl: float) -> Response | None:
+        # pylint: disable=import-outside-toplevel
+        from .datareader import create_response
+
+        path = self._path(url)
+        try:
+            with path.open("rb") as file:
+                entry = pickle.load(file)
+            os.utime(path)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        if entry["url"] != url or time.time() - entry["stored"] > ttl:
+            return None
+        return create_response(
+            url, entry["status_code"], entry["content"], entry["headers"]
+        )
+
+    def put(self, url: str, response: Response) -> None:
+        entry = {
+            "url": url,
+            "status_code": response.status_code,
+            "headers": dict(response.headers),
+            "content": response.content,
+            "stored": time.time(),
+        }
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(url)
+        temp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}")
+        with temp_path.open("wb") as file:
+            pickle.dump(entry, file)
+        size = temp_path.stat().st_size
+        os.replace(temp_path, path)
+        with self._lock:
+            if self._current_bytes is None:
+                self._current_bytes = self._scan_size()
+            else:
+                self._current_bytes += size
+            if self._current_bytes > self.max_bytes:
+                self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            for path in self.directory.glob("*.pickle"):
+                path.unlink(missing_ok=True)
+            self._current_bytes = 0
+
+    def _scan_size(self) -> int:
+        return sum(path.stat().st_size for path in self.directory.glob("*.pickle"))
+
+    def _evict(self) -> None:
+        entries = []
+        for path in self.directory.glob("*.pickle"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        current_bytes = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if current_bytes <= target:
+                break
+            path.unlink(missing_ok=True)
+            current_bytes -= size
+        self._current_bytes = current_bytes
+
+
+response_cache = ResponseCache(
+    lib_settings.data_dir.joinpath(".cache", "responses"),
+    lib_settings.response_cache_size * 2**20,
+)
@@ -0,0 +1,131 @@
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import random
+import threading
+import time
+from typing import Literal
+
+from .metadata_reader import lib_settings
+
+
+@dataclass
+class RetryPolicy:
+    """Exponential backoff with full jitter, honouring `Retry-After`.
+
+    Fatal responses with a `blocking_status` mean the host refuses every
+    request and count as failures for the circuit breaker.
+    """
+
+    attempts: int = 5
+    base_delay: float = 1
+    max_delay: float = 120
+    retryable_status: set[int] = field(
+        default_factory=lambda: {408, 425, 429, 500, 502, 503, 504}
+    )
+    blocking_status: set[int] = field(default_factory=lambda: {401, 403})
+
+    def classify(self, status_code: int) -> Literal["ok", "retry", "fatal"]:
+        if status_code in self.retryable_status:
+            return "retry"
+        if status_code >= 400:
+            return "fatal"
+        return "ok"
+
+    def delay(self, attempt: int, retry_after: float | None = None) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((retry_date - datetime.now(timezone.utc)).total_seconds(), 0)
+
+
+class CircuitBreaker:
+    """Pauses every request to a host while its recent error rate is high.
+
+    After `cooldown` seconds a single request is let through as a probe;
+    its failure opens the circuit again and its success closes it.
+    """
+
+    def __init__(
+        self,
+        host: str | None,
+        window: int = 100,
+        error_rate: float = 0.5,
+        min_requests: int = 50,
+        cooldown: float = 60,
+    ) -> None:
+        self.host = host
+        self.error_rate = error_rate
+        self.min_requests = min_requests
+        self.cooldown = cooldown
+        self.outcomes: deque[bool] = deque(maxlen=window)
+        self.opened_at: float | None = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    def wait_time(self) -> float:
+        """Seconds to wait before asking again; zero when a request may go."""
+        with self._lock:
+            if self.opened_at is None:
+                return 0
+            remaining = self.opened_at + self.cooldown - time.monotonic()
+            if remaining > 0:
+                return remaining
+            if not self.probing:
+                self.probing = True
+                return 0
+            return min(self.cooldown, 1)
+
+    def record(self, success: bool) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if self.opened_at is not None:
+                if not self.probing:
+                    return
+                self.probing = False
+                if success:
+                    self.opened_at = None
+                else:
+                    self._open(now)
+                return
+            self.outcomes.append(success)
+            failures = self.outcomes.count(False)
+            if len(self.outcomes) < self.min_requests:
+                return
+            if failures / len(self.outcomes) >= self.error_rate:
+                self._open(now)
+
+    def _open(self, now: float) -> None:
+        self.opened_at = now
+        self.outcomes.clear()
+        print(f"Too many errors from {self.host}. Pausing for {self.cooldown}s ...")
+
+
+_circuit_breakers: dict[str | None, CircuitBreaker] = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(host: str | None) -> CircuitBreaker:
+    with _circuit_breakers_lock:
+        if host not in _circuit_breakers:
+            _circuit_breakers[host] = CircuitBreaker(
+                host, **lib_settings.circuit_breaker
+            )
+        return _circuit_breakers[host]
+
+
+default_retry_policy = RetryPolicy(**lib_settings.retry)
@@ -0,0 +1,74 @@
+import bisect
+import itertools
+from pathlib import Path
+import pickle
+import re
+
+import pandas as pd
+
+from .metadata_reader import Table
+
+_special_characters = re.compile(r"[.^$*+?{}\[\]\\|()]")
+
+
+class SecurityIndex:
+    """Lookup table from security keys to row positions of the key table.
+
+    Literal patterns and patterns like `اخزا*` are resolved by a prefix
+    search over the sorted keys, giving the same matches as `str.match`.
+    Other regular expressions are left to the caller.
+    """
+
+    def __init__(self, key_table: pd.DataFrame, version: tuple[int, int]) -> None:
+        self.version = version
+        self.exact: dict[str, list[int]] = {}
+        for column in key_table.columns:
+            for position, value in enumerate(key_table[column]):
+                if isinstance(value, str):
+                    self.exact.setdefault(value, []).append(position)
+        self.sorted_keys = sorted(self.exact)
+
+    def lookup(self, pattern: str) -> list[int] | None:
+        literal = pattern[:-1] if pattern.endswith("*") else pattern
+        if literal == "" or _special_characters.search(literal):
+            return None
+        # As a regular expression `x*` also matches zero repeats of `x`
+        prefix = literal[:-1] if pattern.endswith("*") else literal
+        start = bisect.bisect_left(self.sorted_keys, prefix)
+        keys = itertools.takewhile(
+            lambda key: key.startswith(prefix), self.sorted_keys[start:]
+        )
+        positions = itertools.chain.from_iterable(self.exact[key] for key in keys)
+        return sorted(set(positions))
+
+
+_indexes: dict[Path, SecurityIndex] = {}
+
+
+def _index_path(table: Table) -> Path:
+    return table.path.parent.joinpath(f".{table.path.stem}_index.pickle")
+
+
+def get_security_index(table: Table, key_table: pd.DataFrame) -> SecurityIndex:
+    """Return the index of `key_table`, the key columns of `table`.
+
+    The index is kept in memory and on disk and only rebuilt when the table
+    file changes.
+    """
+    stat = table.path.stat()
+    version = (stat.st_mtime_ns, stat.st_size)
+    index = _indexes.get(table.path)
+    if index is not None and index.version == version:
+        return index
+    index_path = _index_path(table)
+    try:
+        with index_path.open(mode="rb") as file:
+            index = pickle.load(file)
+    except (FileNotFoundError, pickle.UnpicklingError, EOFError):
+        index = None
+    if index is None or index.version != version:
+        index = SecurityIndex(key_table, version)
+        with index_path.open(mode="wb") as file:
+            pickle.dump(index, file)
+    _indexes[table.path] = index
+    return index
@@ -0,0 +1,94 @@
+from collections import OrderedDict
+from pathlib import Path
+import threading
+
+import pyarrow as pa
+
+from .dataset import read_dataset
+from .metadata_reader import lib_settings
+
+
+CacheKey = tuple[Path, int, int, tuple[str, ...] | None, tuple | None]
+
+
+class TableCache:
+    """LRU cache of decoded parquet files bounded by their Arrow size.
+
+    Entries are keyed by file version (mtime and size), so a refreshed file
+    is never served from the cache and its old entries are dropped.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._tables: OrderedDict[CacheKey, pa.Table] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: CacheKey) -> pa.Table | None:
+        with self._lock:
+            table = self._tables.get(key)
+            if table is not None:
+                self._tables.move_to_end(key)
+            return table
+
+    def put(self, key: CacheKey, table: pa.Table) -> None:
+        if table.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            for old_key in list(self._tables):
+                if old_key[0] == key[0] and old_key[1:3] != key[1:3]:
+                    self._remove(old_key)
+            if key in self._tables:
+                self._remove(key)
+            self._tables[key] = table
+            self.current_bytes += table.nbytes
+            while self.current_bytes > self.max_bytes:
+                self._remove(next(iter(self._tables)))
+
+    def invalidate(self, path: Path) -> None:
+        with self._lock:
+            for key in list(self._tables):
+                if key[0] == path:
+                    self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tables.clear()
+            self.current_bytes = 0
+
+    def _remove(self, key: CacheKey) -> None:
+        self.current_bytes -= self._tables.pop(key).nbytes
+
+
+table_cache = TableCache(lib_settings.table_cache_size * 2**20)
+
+
+def _freeze_filters(filters: list[tuple] | None) -> tuple | None:
+    if filters is None:
+        return None
+    frozen = []
+    for column, operator, value in filters:
+        if isinstance(value, pa.Array):
+            value = value.to_pylist()
+        if isinstance(value, list):
+            value = tuple(value)
+        frozen.append((column, operator, value))
+    return tuple(frozen)
+
+
+def read_table(
+    path: Path, columns: list[str] | None = None, filters: list[tuple] | None = None
+) -> pa.Table:
+    stat = path.stat()
+    key = (
+        path,
+        stat.st_mtime_ns,
+        stat.st_size,
+        None if columns is None else tuple(columns),
+        _freeze_filters(filters),
+    )
+    table = table_cache.get(key)
+    if table is None:
+        table = read_dataset(path, columns, filters)
+        table_cache.put(key, table)
+    return table
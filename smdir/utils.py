@@ -1,11 +1,23 @@
 from datetime import datetime
 from pathlib import Path
+import hashlib
+import json
+import os
+import re
+import threading
+import time
 
 import requests
 import pandas as pd
 
 from .metadata_reader import lib_settings
 
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_ATTEMPTS = 5
+
+_download_locks: dict[Path, threading.Lock] = {}
+_download_locks_guard = threading.Lock()
+
 
 def add_received_time(table: pd.DataFrame) -> pd.DataFrame:
     table["received_time"] = datetime.now()
@@ -34,11 +46,143 @@ def is_file_up_to_date(file_path: Path) -> bool:
     return local_file == online_file
 
 
-def download_file(file_path: Path) -> None:
+def _file_metadata_path(file_path: Path, kind: str | None = None) -> Path:
+    suffix = "json" if kind is None else f"{kind}.json"
+    return file_path.parent.joinpath(f".{file_path.name}.{suffix}")
+
+
+def read_file_metadata(file_path: Path, kind: str | None = None) -> dict | None:
+    try:
+        with _file_metadata_path(file_path, kind).open(encoding="utf-8") as file:
+            metadata = json.load(file)
+        local_file = file_path.stat()
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if metadata.get("local_size") != local_file.st_size:
+        return None
+    if metadata.get("local_mtime") != local_file.st_mtime_ns:
+        return None
+    return metadata
+
+
+def write_file_metadata(
+    file_path: Path, metadata: dict, kind: str | None = None
+) -> None:
+    local_file = file_path.stat()
+    metadata = metadata | {
+        "local_size": local_file.st_size,
+        "local_mtime": local_file.st_mtime_ns,
+    }
+    with _file_metadata_path(file_path, kind).open(mode="w", encoding="utf-8") as file:
+        json.dump(metadata, file)
+
+
+def download_file(file_path: Path, *, ttl: float | None = None) -> bool:
+    """Download the file unless the local copy matches the online one.
+
+    Unchanged files cost one conditional request, or none within `ttl`
+    seconds of the last check. Returns whether the file was downloaded.
+    """
+    with _download_locks_guard:
+        lock = _download_locks.setdefault(file_path, threading.Lock())
+    with lock:
+        return _download_file(file_path, ttl)
+
+
+def _download_file(file_path: Path, ttl: float | None) -> bool:
+    ttl = lib_settings.download_ttl if ttl is None else ttl
     url = f"{lib_settings.online_dir}/{create_key_form_path(file_path)}"
-    response = requests.get(url, timeout=100)
-    with file_path.open(mode="wb") as file:
-        file.write(response.content)
+    metadata = read_file_metadata(file_path)
+    headers = {}
+    if metadata is not None:
+        if time.time() - metadata["checked"] < ttl:
+            return False
+        if metadata["etag"] is not None:
+            headers["If-None-Match"] = metadata["etag"]
+        if metadata["last_modified"] is not None:
+            headers["If-Modified-Since"] = metadata["last_modified"]
+
+    response = requests.get(url, headers=headers, timeout=100, stream=True)
+    if response.status_code == 304 and metadata is not None:
+        metadata["checked"] = time.time()
+        write_file_metadata(file_path, metadata)
+        return False
+    response.raise_for_status()
+    size = _stream_to_file(url, response, file_path)
+    write_file_metadata(
+        file_path,
+        {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "size": size,
+            "checked": time.time(),
+        },
+    )
+    return True
+
+
+def _stream_to_file(url: str, response: requests.Response, file_path: Path) -> int:
+    """Write the response body to `file_path` through a temporary file.
+
+    Interrupted transfers are resumed with a `Range` request. The result is
+    checked against Content-Length and, for single part S3 objects, the MD5
+    ETag before it atomically replaces the old file. Neither check applies to
+    bodies with a Content-Encoding, which are decoded while streaming.
+    """
+    temp_path = file_path.with_name(f"{file_path.name}.part")
+    etag = response.headers.get("ETag")
+    if "Content-Encoding" in response.headers:
+        expected_size = None
+    else:
+        expected_size = int(response.headers.get("Content-Length", -1))
+    digest = hashlib.md5()
+    written = 0
+    try:
+        with temp_path.open(mode="wb") as file:
+            for attempt in range(DOWNLOAD_ATTEMPTS):
+                try:
+                    if attempt > 0:
+                        headers = {"Range": f"bytes={written}-"}
+                        if etag is not None:
+                            headers["If-Range"] = etag
+                        response = requests.get(
+                            url, headers=headers, timeout=100, stream=True
+                        )
+                        if response.status_code == 200:
+                            file.seek(0)
+                            file.truncate()
+                            digest = hashlib.md5()
+                            written = 0
+                        elif response.status_code != 206:
+                            response.raise_for_status()
+                    for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                        file.write(chunk)
+                        digest.update(chunk)
+                        written += len(chunk)
+                    break
+                except (
+                    requests.exceptions.ConnectionError,
+                    requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout,
+                ):
+                    if attempt == DOWNLOAD_ATTEMPTS - 1:
+                        raise
+                    print(f"Download of {file_path.name} interrupted. Resuming ...")
+                    time.sleep(attempt + 1)
+        if expected_size not in (None, -1) and written != expected_size:
+            raise IOError(
+                f"Downloaded {written} bytes of {file_path.name}, "
+                f"expected {expected_size}"
+            )
+        # The ETag of an encoded object is the MD5 of the encoded bytes
+        md5_etag = etag is not None and re.fullmatch(r'"?[0-9a-f]{32}"?', etag)
+        if expected_size is not None and md5_etag:
+            if digest.hexdigest() != etag.strip('"'):
+                raise IOError(f"Checksum mismatch for {file_path.name}")
+        os.replace(temp_path, file_path)
+    finally:
+        temp_path.unlink(missing_ok=True)
+    return written
 
 
 def split_dataframe(df: pd.DataFrame, n: int = 4) -> list[pd.DataFrame]:
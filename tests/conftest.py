@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+
+def pytest_configure(config):  # pylint: disable=unused-argument
+    # smdir creates its data directory relative to the working directory
+    os.chdir(tempfile.mkdtemp(prefix="smdir-tests-"))
@@ -0,0 +1,103 @@
+import json
+from datetime import datetime
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from smdir.datareader import DataReader
+from smdir.metadata_reader import Column, Table, lib_settings
+from smdir.raw_store import RawStore, payload_hash
+
+
+@pytest.fixture(name="table_metadata")
+def fixture_table_metadata(tmp_path):
+    class TableMetadata(Table):
+        directory = tmp_path
+        name = "sample"
+        api_params = ["key"]
+        keys = ["key"]
+        Value = Column("value")
+
+    return TableMetadata()
+
+
+class SampleReader(DataReader):
+    headers: dict = {}
+    max_workers = 1
+
+    def __init__(self, table_metadata: Table, fail_on: str | None = None) -> None:
+        super().__init__("https://example.com/{key}", table_metadata)
+        self.fail_on = fail_on
+        self.requested: list[str] = []
+
+    def get(self, **kwargs) -> dict:
+        if kwargs["key"] == self.fail_on:
+            raise KeyboardInterrupt
+        self.requested.append(kwargs["key"])
+        return {"value": int(kwargs["key"])}
+
+
+def raw_rows(keys: list[str], value: int = 0) -> pd.DataFrame:
+    texts = [json.dumps({"value": int(key) + value}) for key in keys]
+    return pd.DataFrame({"key": keys, "JSON": texts, "recived_time": datetime.now()})
+
+
+def test_compact_merges_segments_and_drops_duplicates(table_metadata):
+    store = RawStore(table_metadata)
+    store.write_segment(raw_rows(["1", "2"]))
+    store.write_segment(raw_rows(["2", "3"]))
+    store.write_segment(raw_rows(["3"], value=10))
+    store.compact()
+
+    assert store.segment_paths() == []
+    raw = store.read()
+    values = raw["JSON"].map(lambda text: json.loads(text)["value"])
+    assert sorted(zip(raw["key"], values)) == [("1", 1), ("2", 2), ("3", 3), ("3", 13)]
+    assert (raw["Hash"] == raw["JSON"].map(payload_hash)).all()
+
+
+def test_compact_keeps_rows_of_the_existing_raw_file(table_metadata):
+    store = RawStore(table_metadata)
+    # A raw file from before hashes and segments
+    raw_rows(["1", "2"]).to_parquet(store.path, index=False)
+    store.write_segment(raw_rows(["2", "3"]))
+    store.compact()
+
+    assert store.segment_paths() == []
+    assert sorted(store.read()["key"]) == ["1", "2", "3"]
+    assert "Hash" in pq.read_schema(store.path).names
+
+
+def test_resume_fetches_only_keys_without_a_checkpoint(table_metadata, monkeypatch):
+    monkeypatch.setattr(lib_settings, "checkpoint_size", 10)
+    keys = pd.DataFrame({"key": [str(key) for key in range(40)]})
+    reader = SampleReader(table_metadata, fail_on="25")
+    with pytest.raises(KeyboardInterrupt):
+        reader.update_raw_table(keys)
+    manifest = reader.raw_store.read_manifest()
+    assert manifest is not None
+    assert manifest["status"] == "fetching"
+    assert manifest["fetched"] == 20
+
+    reader = SampleReader(table_metadata)
+    assert reader.resume_raw_table()
+    assert reader.requested == [str(key) for key in range(20, 40)]
+    assert reader.raw_store.read_manifest() is None
+    assert reader.raw_store.segment_paths() == []
+    raw = reader.raw_store.read()
+    assert sorted(raw["key"], key=int) == keys["key"].to_list()
+    assert not reader.resume_raw_table()
+
+
+def test_resume_finishes_an_interrupted_compaction(table_metadata):
+    reader = SampleReader(table_metadata)
+    reader.update_raw_table(pd.DataFrame({"key": ["1", "2"]}), compact=False)
+    reader.raw_store.start_run(pd.DataFrame({"key": ["3"]}))
+    reader.raw_store.write_segment(raw_rows(["3"]))
+    reader.raw_store.set_run_status("compacting")
+
+    assert reader.resume_raw_table()
+    assert reader.requested == ["1", "2"]
+    assert reader.raw_store.segment_paths() == []
+    assert sorted(reader.raw_store.read()["key"]) == ["1", "2", "3"]
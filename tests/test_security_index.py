@@ -0,0 +1,45 @@
+import pandas as pd
+import pytest
+
+from smdir import search_security
+from smdir.security_index import SecurityIndex
+
+key_table = pd.DataFrame(
+    {
+        "INS_Code": ["111", "222", "333", "444", "555"],
+        "ISIN": ["IRO1FOLD0001", "IRO1FOLX0001", "IRB3TB010001", None, "IRO1AKHZ0001"],
+        "Farsi_Symbol": ["فولاد", "فولادی", "اخزا101", "اخزا102", None],
+    }
+)
+
+
+@pytest.mark.parametrize(
+    "pattern",
+    [
+        "فولاد",
+        "فولادی",
+        "IRO1FOLD",
+        "IRO1FOLD0001",
+        "111",
+        "nomatch",
+        "ف",
+        "I",
+        "اخزا*",
+        "اخزا10*",
+        "فولاد*",
+        "IRO1*",
+        "ا*",
+        "1*",
+    ],
+)
+def test_lookup_matches_search_security(pattern):
+    positions = SecurityIndex(key_table, (0, 0)).lookup(pattern)
+    assert positions is not None
+    pd.testing.assert_frame_equal(
+        key_table.iloc[positions], search_security(key_table, pattern)
+    )
+
+
+@pytest.mark.parametrize("pattern", ["فول.*", "^IRO1", "IRO1|IRB3", "*"])
+def test_lookup_leaves_regular_expressions_to_the_caller(pattern):
+    assert SecurityIndex(key_table, (0, 0)).lookup(pattern) is None